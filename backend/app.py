@@ -15,6 +15,12 @@ import pytz
 from urllib.parse import unquote
 import asyncio
 import html
+from tg_gateway import gateway, PRIORITY_REPORT
+from circuit_breaker import GuardedSheetsClient, all_states as breaker_states
+from clan_online import clan_online, clean_nick
+from online_aggregator import online_aggregator
+from presence_log import presence_log
+from sqstat_leaderboard import leaderboard, METRICS as LEADERBOARD_METRICS
 load_dotenv()
 
 app = FastAPI(title="PET Clan Mini App")
@@ -35,7 +41,7 @@ logger = logging.getLogger(__name__)
 scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
 creds_data = json.loads(os.getenv("CREDS_JSON"))
 creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_data, scope)
-client = gspread.authorize(creds)
+client = gspread.authorize(creds, client_factory=GuardedSheetsClient)  # запросы к Sheets — через предохранитель
 sheet = client.open_by_key(os.getenv("SPREADSHEET_KEY"))
 
 # Админы
@@ -359,9 +365,7 @@ def get_notifications(user_id):
 async def send_devlog_to_telegram(title: str, content: str, author: str, photo_url: str = None):
     """Отправляет девлог в группу в нужный топик"""
     try:
-        # Импортируем бота внутри функции, чтобы избежать конфликтов циклов
-        from bot import bot
-
+        # Бот живёт в своём потоке и loop — отправляем через шлюз
         report_chat = os.getenv("REPORT_CHAT_ID")
         devlog_topic = os.getenv("DEVLOGS_TOPIC_ID")
 
@@ -377,19 +381,21 @@ async def send_devlog_to_telegram(title: str, content: str, author: str, photo_u
         topic_id = int(devlog_topic) if devlog_topic and devlog_topic.isdigit() else None
 
         if photo_url:
-            await bot.send_photo(
+            await gateway.send_photo(
                 chat_id=chat_id,
                 photo=photo_url,
                 caption=text,
                 parse_mode="HTML",
-                message_thread_id=topic_id
+                message_thread_id=topic_id,
+                priority=PRIORITY_REPORT
             )
         else:
-            await bot.send_message(
+            await gateway.send_message(
                 chat_id=chat_id,
                 text=text,
                 parse_mode="HTML",
-                message_thread_id=topic_id
+                message_thread_id=topic_id,
+                priority=PRIORITY_REPORT
             )
     except Exception as e:
         logger.error(f"❌ Ошибка отправки девлога в Telegram: {e}")
@@ -739,6 +745,79 @@ async def get_roles_api():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/online")
+async def get_online_api():
+    """Онлайн клана из снапшота фонового опроса — без запроса к sqstat"""
+    snapshot = clan_online.peek_snapshot()
+    if not snapshot:
+        return {"players": [], "total": 0, "updated_at": None}
+    players = [
+        {"nick": clean_nick(p["nick"]), "server": p["server"], "server_id": p["server_id"]}
+        for p in snapshot.get("players", [])
+    ]
+    return {
+        "players": players,
+        "total": len(players),
+        "updated_at": datetime.fromtimestamp(snapshot["fetched_at"], pytz.timezone("Europe/Moscow")).isoformat()
+    }
+
+
+@app.get("/api/online/all")
+async def get_online_all_api():
+    """Общий онлайн sqstat + krestgg из кэшей, с привязкой к участникам клана"""
+    try:
+        return online_aggregator.peek_view()
+    except Exception as e:
+        logger.error(f"Online aggregate error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/presence/last_seen")
+async def get_presence_last_seen(nick: str):
+    seen = presence_log.last_seen(nick)
+    if not seen:
+        raise HTTPException(status_code=404, detail="Игрок не найден в журнале")
+    ts, server, name = seen
+    return {"nick": name, "server": server, "ts": ts}
+
+
+@app.get("/api/presence/heatmap")
+async def get_presence_heatmap(days: int = 7):
+    days = max(1, min(days, 90))
+    now = int(datetime.now().timestamp())
+    return {"days": days, "hours": presence_log.heatmap(now - days * 86400, now)}
+
+
+@app.get("/api/presence/players")
+async def get_presence_players(days: int = 7):
+    """Кто играл за период: отсчёты ≈ минуты в сети"""
+    days = max(1, min(days, 90))
+    now = int(datetime.now().timestamp())
+    rows = presence_log.player_minutes(now - days * 86400, now)
+    return {"days": days, "players": [{"nick": n, "minutes": m} for n, m in rows]}
+
+
+@app.get("/api/health/upstreams")
+async def get_upstreams_health():
+    """Состояние предохранителей внешних сервисов"""
+    return {"upstreams": breaker_states()}
+
+
+@app.get("/api/leaderboard")
+async def get_leaderboard_api(metric: str = "kd", limit: int = 10):
+    """Рейтинг клана по sqstat из сохранённых данных"""
+    if metric not in LEADERBOARD_METRICS:
+        raise HTTPException(status_code=400, detail=f"metric: {', '.join(LEADERBOARD_METRICS)}")
+    limit = max(1, min(limit, 100))
+    field, title = LEADERBOARD_METRICS[metric]
+    rows = leaderboard.ranking(metric, limit=limit)
+    return {
+        "metric": metric,
+        "title": title,
+        "top": [{"nick": r["nick"], "value": r[field], "updated_at": r["updated_at"]} for r in rows]
+    }
+
+
 # =========================
 # 🆕 НОВЫЕ API ENDPOINTS
 # =========================
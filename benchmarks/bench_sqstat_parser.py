@@ -0,0 +1,157 @@
+# benchmarks/bench_sqstat_parser.py
+"""
+Сравнение парсеров профиля sqstat: старый (BeautifulSoup + regex по всему тексту,
+как был в bot.py) и sqstat_parser.parse_profile.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_sqstat_parser.py [--runs 200] [fixture.html ...]
+
+Печатает среднее время разбора и пик аллокаций (tracemalloc) для каждой фикстуры
+и проверяет, что ключевые поля у обоих парсеров совпадают.
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from sqstat_parser import parse_profile  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+COMPARED_FIELDS = ['kd', 'winrate', 'kills', 'deaths', 'damage', 'revives', 'matches', 'wins', 'losses', 'playtime']
+
+
+def legacy_parse(html: str) -> dict:
+    """Разбор из fetch_sqstat_profile до переноса в sqstat_parser (для сравнения)"""
+    soup = BeautifulSoup(html, 'lxml')
+    stats = {}
+    text_content = soup.get_text(separator='\n', strip=True)
+    lines = [l.strip() for l in text_content.split('\n') if l.strip()]
+
+    def find_numeric_value(label: str, allow_percent: bool = False):
+        percent_pattern = r'[\d\s,]+\.?\d*%' if allow_percent else r'[\d\s,]+\.?\d*'
+        pattern = rf'{re.escape(label)}\s*[:\s\n]*\s*({percent_pattern})'
+        match = re.search(pattern, text_content, re.IGNORECASE)
+        if match:
+            raw = match.group(1).strip()
+            cleaned = re.sub(r'[^\d.,%]', '', raw)
+            if cleaned and (cleaned.replace('.', '').replace(',', '').replace('%', '').isdigit()):
+                return cleaned.replace(',', '.')
+        return None
+
+    def find_any_value(label: str):
+        pattern = rf'{re.escape(label)}\s*[:\s\n]*\s*([^\n]+?)(?:\n|$)'
+        match = re.search(pattern, text_content, re.IGNORECASE)
+        return match.group(1).strip() if match and match.group(1).strip() else None
+
+    stats['kd'] = find_numeric_value('К/Д')
+    stats['winrate'] = find_numeric_value('Винрейт', allow_percent=True)
+    stats['kills'] = find_numeric_value('УБИЙСТВА')
+    stats['deaths'] = find_numeric_value('СМЕРТИ')
+    stats['damage'] = find_numeric_value('УРОН')
+    stats['revives'] = find_numeric_value('ПОДНЯТИЯ')
+    stats['matches'] = find_numeric_value('МАТЧЕЙ')
+    stats['wins'] = find_numeric_value('ПОБЕД')
+    stats['losses'] = find_numeric_value('ПРОИГРЫШЕЙ')
+
+    raw_playtime = find_numeric_value('ОНЛАЙН')
+    if raw_playtime:
+        try:
+            total_minutes = int(float(raw_playtime.replace(',', '.')))
+            hours = total_minutes // 60
+            minutes = total_minutes % 60
+            stats['playtime'] = f"{hours}ч {minutes:02d}м" if hours > 0 else f"{minutes}м"
+        except:
+            stats['playtime'] = raw_playtime
+    else:
+        alt_time = find_any_value('ОНЛАЙН')
+        if alt_time and any(c.isdigit() for c in alt_time):
+            stats['playtime'] = alt_time[:20]
+
+    weapons = []
+    weapon_names = ['M16A4', 'M4A1', 'AK-12', 'AKM', 'SCAR-H', 'QBZ-03', 'AUG-A3', 'MP7', 'M249', 'PKM']
+    for line in lines:
+        for wname in weapon_names:
+            if wname.lower() in line.lower():
+                nums = re.findall(r'[\d]+', line)
+                if nums:
+                    weapons.append({'name': wname, 'kills': nums[-1]})
+                break
+        if len(weapons) >= 3:
+            break
+    stats['top_weapons'] = weapons
+
+    matches = []
+    seen_maps = set()
+    for line in lines:
+        if any(m in line for m in
+               ['Gorodok', 'Breakwater', 'Lashkar', 'Khanji', 'Tallil', 'Yehorivka', 'Fallujah']):
+            if line[:30] not in seen_maps:
+                result = "⚪"
+                idx = lines.index(line) if line in lines else -1
+                if idx >= 0:
+                    context = ' '.join(lines[max(0, idx - 2):min(len(lines), idx + 3)]).lower()
+                    if any(x in context for x in ['победа', 'да', 'выигрыш']):
+                        result = "✅"
+                    elif any(x in context for x in ['пораж', 'нет', 'проигр']):
+                        result = "❌"
+                matches.append({'map': line[:30], 'result': result})
+                seen_maps.add(line[:30])
+        if len(matches) >= 3:
+            break
+    stats['recent_matches'] = matches
+    return stats
+
+
+def measure(parse, html: str, runs: int):
+    """(среднее время, мс; пик памяти за один разбор, КБ)"""
+    parse(html)  # прогрев
+    start = time.perf_counter()
+    for _ in range(runs):
+        parse(html)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / runs
+
+    tracemalloc.start()
+    parse(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed_ms, peak / 1024
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("fixtures", nargs="*")
+    arg_parser.add_argument("--runs", type=int, default=200)
+    args = arg_parser.parse_args()
+
+    paths = args.fixtures or sorted(
+        os.path.join(FIXTURES_DIR, name) for name in os.listdir(FIXTURES_DIR) if name.endswith(".html")
+    )
+
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+
+        old, new = legacy_parse(html), parse_profile(html)
+        diffs = [field for field in COMPARED_FIELDS if old.get(field) != new.get(field)]
+        if [w['kills'] for w in old['top_weapons']] != [w['kills'] for w in new['top_weapons']]:
+            diffs.append('top_weapons')
+
+        old_ms, old_kb = measure(legacy_parse, html, args.runs)
+        new_ms, new_kb = measure(parse_profile, html, args.runs)
+
+        print(f"📄 {os.path.basename(path)} ({len(html) // 1024} КБ, {args.runs} прогонов)")
+        print(f"   legacy:        {old_ms:8.2f} мс   пик {old_kb:8.1f} КБ")
+        print(f"   parse_profile: {new_ms:8.2f} мс   пик {new_kb:8.1f} КБ")
+        print(f"   ускорение x{old_ms / new_ms:.1f}, память x{old_kb / new_kb:.1f}")
+        print(f"   расхождения: {', '.join(diffs) if diffs else 'нет'}")
+
+
+if __name__ == "__main__":
+    main()
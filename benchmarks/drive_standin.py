@@ -0,0 +1,148 @@
+# benchmarks/drive_standin.py
+"""
+Локальный стенд resumable-загрузки Drive для drive_uploader.ResumableUpload.
+
+Поднимает aiohttp-сервер с протоколом загрузки (POST сессии, PUT кусков,
+PUT bytes */N для позиции), который намеренно сбоит: часть запросов получает 503,
+часть принимается не полностью. Затем параллельно грузит несколько файлов и
+проверяет, что собранное на сервере совпадает с отправленным.
+
+Запуск из корня репозитория:
+    python benchmarks/drive_standin.py [--files 4] [--size-mb 20] [--fail-rate 0.2]
+"""
+import os
+import sys
+import random
+import asyncio
+import argparse
+import hashlib
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import aiohttp  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+import drive_uploader  # noqa: E402
+from circuit_breaker import breakers, CircuitOpenError  # noqa: E402
+
+
+class StandIn:
+    def __init__(self, fail_rate: float, seed: int = 1):
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.sessions = {}   # id → {'size', 'data': bytearray, 'name'}
+        self.files = {}      # id файла → байты
+        self.requests = 0
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/upload/drive/v3/files", self.create_session)
+        app.router.add_put("/upload/session/{sid}", self.put_chunk)
+        return app
+
+    async def create_session(self, request: web.Request):
+        self.requests += 1
+        meta = await request.json()
+        sid = f"s{len(self.sessions) + 1}"
+        self.sessions[sid] = {
+            'size': int(request.headers['X-Upload-Content-Length']),
+            'data': bytearray(),
+            'name': meta['name'],
+        }
+        return web.Response(status=200, headers={'Location': f"http://{request.host}/upload/session/{sid}"})
+
+    def _status(self, session):
+        received = len(session['data'])
+        headers = {'Range': f"bytes=0-{received - 1}"} if received else {}
+        return web.Response(status=308, headers=headers)
+
+    async def put_chunk(self, request: web.Request):
+        self.requests += 1
+        session = self.sessions.get(request.match_info['sid'])
+        if session is None:
+            return web.Response(status=404)
+        body = await request.read()
+        content_range = request.headers['Content-Range']
+        if self.random.random() < self.fail_rate:
+            return web.Response(status=503, text="стенд: сбой")  # сбоит и запрос позиции
+        if content_range.startswith("bytes */"):
+            return self._status(session)
+
+        start = int(content_range.split()[1].split("-")[0])
+        if start != len(session['data']):
+            return self._status(session)  # клиент ошибся с позицией — сообщаем правильную
+        if self.random.random() < self.fail_rate:
+            body = body[:len(body) // 2 // (256 * 1024) * (256 * 1024)]  # принята только часть
+        session['data'] += body
+
+        if len(session['data']) < session['size']:
+            return self._status(session)
+        file_id = f"f{len(self.files) + 1}"
+        self.files[file_id] = bytes(session['data'])
+        return web.json_response({'id': file_id, 'name': session['name'],
+                                  'webViewLink': f"https://drive.example/{file_id}"})
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--files", type=int, default=4)
+    ap.add_argument("--size-mb", type=float, default=20)
+    ap.add_argument("--fail-rate", type=float, default=0.2)
+    args = ap.parse_args()
+
+    drive_uploader.TARGET_CHUNK_SECONDS = 0.05  # локально всё быстро — пусть кусок всё равно меняется
+    breakers['google_drive'].reset_timeout = 1  # настоящий предохранитель, только пауза в локальном масштабе
+    standin = StandIn(args.fail_rate)
+    runner = web.AppRunner(standin.app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    async def token():
+        return "standin-token"
+
+    waits = [0] * args.files  # сколько раз файл ждал открытый предохранитель
+    async with aiohttp.ClientSession() as session:
+        async def upload_one(i: int):
+            payload = os.urandom(int(args.size_mb * 1024 * 1024) + i)
+            spool = tempfile.SpooledTemporaryFile(max_size=drive_uploader.MAX_CHUNK)
+            spool.write(payload)
+            upload = drive_uploader.ResumableUpload(
+                spool, f"clip_{i}.mp4", base_url=f"http://127.0.0.1:{port}",
+                token_provider=token, session=session)
+            attempt = 0
+            while True:  # как повторы конвейера клипов: открытый предохранитель попыткой не считается
+                try:
+                    result = await upload.run()
+                    break
+                except CircuitOpenError as e:
+                    waits[i] += 1
+                    await asyncio.sleep(max(0.2, e.retry_in))
+                except Exception as e:
+                    attempt += 1
+                    if attempt >= 10:
+                        raise RuntimeError(f"файл {i} не загружен") from e
+                    print(f"  файл {i}: попытка {attempt} упала ({e}), продолжаю сессию")
+                    await asyncio.sleep(0.1)
+            ok = hashlib.sha256(standin.files[result['id']]).digest() == hashlib.sha256(payload).digest()
+            return i, ok, upload.stats, upload.chunk_size
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(upload_one(i) for i in range(args.files)))
+        elapsed = time.perf_counter() - started
+
+    await runner.cleanup()
+    for i, ok, stats, chunk in results:
+        print(f"файл {i}: {'OK' if ok else 'НЕ СОВПАДАЕТ'} {stats} последний кусок {chunk // 1024} КБ")
+    print(f"{args.files} × {args.size_mb} МБ за {elapsed:.2f} с, запросов к стенду: {standin.requests}, "
+          f"ожиданий предохранителя: {sum(waits)}, {breakers['google_drive'].snapshot()}")
+    if not all(ok for _, ok, _, _ in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
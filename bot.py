@@ -7,6 +7,7 @@ import html as html_lib
 from aiogram import Bot, Dispatcher, types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils import executor
+from aiogram.utils.exceptions import MessageNotModified
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
@@ -14,13 +15,24 @@ import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from gdrive import upload_video_to_drive
+from apscheduler.triggers.interval import IntervalTrigger
+from gdrive import refresh_credentials as refresh_drive_credentials
+from clip_pipeline import clip_pipeline, ClipJob
 import pytz
 import time
 from datetime import datetime
-from krestgg_parser import parser as krest_parser  # импорт нашего парсера
+from krestgg_parser import parser as krest_parser, REFRESH_INTERVAL as KRESTGG_REFRESH_INTERVAL  # импорт нашего парсера
+from krestgg_worker import KrestGGWorkerClient, USE_WORKER as KRESTGG_USE_WORKER
 from aiogram.types import WebAppInfo  # ← Добавить в импорты
 import asyncio
+import http_client
+from sqstat_profiles import get_sqstat_profile, profile_cache as sqstat_profile_cache
+from sqstat_leaderboard import leaderboard as sqstat_leaderboard, METRICS as LEADERBOARD_METRICS, REFRESH_INTERVAL as LEADERBOARD_INTERVAL
+from clan_online import clan_online, clean_nick, POLL_INTERVAL as ONLINE_POLL_INTERVAL
+from online_aggregator import online_aggregator, render_view as render_online_view
+from presence_log import presence_log, SAMPLE_INTERVAL as PRESENCE_SAMPLE_INTERVAL
+from circuit_breaker import GuardedSheetsClient, all_states as breaker_states, STATE_EMOJI
+from tg_gateway import gateway, PRIORITY_ALERT, PRIORITY_REPORT, PRIORITY_BROADCAST
 # =========================
 # 🔧 НАСТРОЙКА LOGGER
 # =========================
@@ -44,7 +56,7 @@ scope = [
 
 creds_data = json.loads(os.getenv("CREDS_JSON"))
 creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_data, scope)
-client = gspread.authorize(creds)
+client = gspread.authorize(creds, client_factory=GuardedSheetsClient)  # запросы к Sheets — через предохранитель
 sheet = client.open_by_key(SPREADSHEET_KEY)
 
 # =========================
@@ -106,6 +118,12 @@ def get_clan_members():
     ws = sheet.worksheet("участники клана")
     return [v for v in ws.col_values(1) if v.strip()]
 
+def get_members_steam_ids():
+    """Пары (ник, steam_id) всех участников клана"""
+    ws = sheet.worksheet("участники клана")
+    rows = ws.get_all_values()[1:]
+    return [(row[0].strip(), row[1].strip()) for row in rows if len(row) >= 2 and row[0].strip()]
+
 def get_member_info(nickname):
     ws = sheet.worksheet("участники клана")
     rows = ws.get_all_values()
@@ -136,6 +154,47 @@ def get_clips_sheet():
             "Дата", "Статус", "Дата одобрения", "Одобрил"
         ])
         return ws
+# =========================
+# 🔔 ПОДПИСКА НА ОНЛАЙН
+# =========================
+_online_subscribers = None  # {tg_id: ник}, читается из таблицы один раз
+
+
+def get_online_subs_sheet():
+    try:
+        return sheet.worksheet("подписка онлайн")
+    except gspread.exceptions.WorksheetNotFound:
+        ws = sheet.add_worksheet("подписка онлайн", rows=100, cols=3)
+        ws.append_row(["TG ID", "Ник клана", "Дата"])
+        return ws
+
+
+def get_online_subscribers():
+    global _online_subscribers
+    if _online_subscribers is None:
+        rows = get_online_subs_sheet().get_all_values()[1:]
+        _online_subscribers = {
+            int(r[0]): (r[1] if len(r) > 1 else '') for r in rows if r and r[0].strip().isdigit()
+        }
+    return _online_subscribers
+
+
+def toggle_online_subscription(tg_id, nickname):
+    """True — подписка включена, False — выключена"""
+    subscribers = get_online_subscribers()
+    ws = get_online_subs_sheet()
+    if tg_id in subscribers:
+        rows = ws.get_all_values()
+        for idx, row in enumerate(rows[1:], start=2):
+            if row and row[0].strip() == str(tg_id):
+                ws.delete_rows(idx)
+                break
+        del subscribers[tg_id]
+        return False
+    ws.append_row([str(tg_id), nickname, get_msk_time().strftime("%d.%m.%Y %H:%M")])
+    subscribers[tg_id] = nickname
+    return True
+
 def find_member_by_tg_id(tg_id):
     ws = sheet.worksheet("участники клана")
     rows = ws.get_all_values()
@@ -379,9 +438,9 @@ async def send_weekly_report():
     report_text = generate_weekly_report()
     try:
         if REPORT_TOPIC_ID and REPORT_TOPIC_ID.isdigit():
-            await bot.send_message(chat_id=REPORT_CHAT_ID, text=report_text, parse_mode="HTML", message_thread_id=int(REPORT_TOPIC_ID))
+            await gateway.send_message(chat_id=REPORT_CHAT_ID, text=report_text, parse_mode="HTML", message_thread_id=int(REPORT_TOPIC_ID), priority=PRIORITY_REPORT)
         else:
-            await bot.send_message(chat_id=REPORT_CHAT_ID, text=report_text, parse_mode="HTML")
+            await gateway.send_message(chat_id=REPORT_CHAT_ID, text=report_text, parse_mode="HTML", priority=PRIORITY_REPORT)
         logging.info("✅ Еженедельный отчёт отправлен")
     except Exception as e:
         logging.error(f"❌ Ошибка отправки отчёта: {e}")
@@ -418,6 +477,33 @@ logging.basicConfig(level=logging.INFO)
 bot = Bot(token=TOKEN)
 dp = Dispatcher(bot, storage=MemoryStorage())
 
+# =========================
+# 📣 УВЕДОМЛЕНИЯ АДМИНАМ (фоном)
+# =========================
+_background_tasks = set()
+
+
+def notify_in_background(recipients, text: str, tag: str, priority: int = PRIORITY_ALERT, **kwargs):
+    """Параллельно рассылает уведомление в фоне — пользователь не ждёт доставки"""
+    task = asyncio.create_task(_fan_out_and_log(list(recipients), text, tag, priority, **kwargs))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def notify_admins(text: str, tag: str, **kwargs):
+    notify_in_background(ADMINS, text, tag, **kwargs)
+
+
+async def _fan_out_and_log(recipients, text: str, tag: str, priority: int, **kwargs):
+    results = await gateway.fan_out(recipients, text, priority=priority, **kwargs)
+    delivered = 0
+    for admin_id, error in results.items():
+        if error is None:
+            delivered += 1
+        else:
+            logging.warning(f"❌ [{tag}] Не удалось уведомить {admin_id}: {type(error).__name__}: {error}")
+    logging.info(f"📣 [{tag}] Доставлено {delivered}/{len(results)}")
+
 # =========================
 # MENU
 # =========================
@@ -502,7 +588,8 @@ async def start(message: types.Message, state: FSMContext):
 
         # 🎨 ФОТО ДЛЯ [PET] КИРЮХА (замени ID на его Telegram ID)
         KIRYUKHA_ID = 123456  # ID из твоих логов (@stone_lord)
-        PHOTO_URL = "https://github.com/serkarim/petbot/blob/4f8525d03638a5df38e357a3fc34402889592a60/photo_2026-03-08_11-27-57.jpg"  # Ссылка на фото
+        # Фото лежит в репозитории — file_id после первой отправки берётся из media_cache
+        PHOTO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "photo_2026-03-08_11-27-57.jpg")
 
         if existing_nick:
             safe_nick = html_lib.escape(existing_nick)
@@ -510,9 +597,9 @@ async def start(message: types.Message, state: FSMContext):
             # Если это КИРЮХА — отправляем с фото
             if user_id == KIRYUKHA_ID:
                 try:
-                    await bot.send_photo(
+                    await gateway.send_photo(
                         chat_id=user_id,
-                        photo=PHOTO_URL,  # Или file_id: "AgACAgIA..."
+                        photo=PHOTO_PATH,
                         caption=(
                             f"👋 <b>С возвращением, Шеф!</b>\n\n"
                             f"✅ Вы зарегистрированы как <b>{safe_nick}</b>\n\n"
@@ -818,50 +905,87 @@ async def receive_clip_link_description(message: types.Message, state: FSMContex
 
 
 async def finalize_clip_submission(message: types.Message, state: FSMContext):
-    """Финализация отправки клипа"""
+    """Финализация отправки клипа: заявка уходит в фоновый конвейер, ответ — сразу"""
     try:
-        # ✅ Исправлено: добавлено 'data:' в конце строки
-        async with state.proxy() as data:
-            description = message.text if message.text != "Пропустить" else ""
-            user_id = message.from_user.id
-
-            # 🔹 Проверяем, какой тип клипа был отправлен
-            clip_video_file_id = data.get('clip_video_file_id')  # Для видео-файла
-            clip_drive_link = data.get('clip_drive_link')  # Для ссылки
-
-            if clip_video_file_id:
-                # 📁 Отправка видео-файлом
-                logging.info(f"📁 Сохранение видео-файла: {clip_video_file_id}")
-                await upload_video_to_drive(
-                    user_id=user_id,
-                    clip_type="video_file",
-                    clip_file_id=clip_video_file_id,
-                    description=description
-                )
-            elif clip_drive_link:
-                # 🔗 Отправка ссылкой
-                logging.info(f"🔗 Сохранение ссылки: {clip_drive_link}")
-                await upload_video_to_drive(
-                    user_id=user_id,
-                    clip_type="link",
-                    clip_url=clip_drive_link,
-                    description=description
-                )
-            else:
-                # ❌ Нет данных о клипе
-                logging.error(f"❌ Нет данных о клипе у пользователя {user_id}")
-                await message.answer("❌ Ошибка: нет данных о клипе. Начните заново.")
-                await state.finish()
-                return
+        data = await state.get_data()
+        description = message.text if message.text != "Пропустить" else ""
+        user_id = message.from_user.id
+
+        # 🔹 Проверяем, какой тип клипа был отправлен
+        clip_video_file_id = data.get('clip_video_file_id')  # Для видео-файла
+        clip_drive_link = data.get('clip_drive_link')  # Для ссылки
 
-            await message.answer("✅ Клип успешно отправлен на модерацию!")
+        if not clip_video_file_id and not clip_drive_link:
+            # ❌ Нет данных о клипе
+            logging.error(f"❌ Нет данных о клипе у пользователя {user_id}")
+            await message.answer("❌ Ошибка: нет данных о клипе. Начните заново.")
+            await state.finish()
+            return
 
+        job = ClipJob(
+            user_id=user_id,
+            username=data.get('clip_username') or message.from_user.username or "",
+            nick=data.get('clip_user_nick') or "",
+            description=description,
+            video_file_id=clip_video_file_id,
+            link=None if clip_video_file_id else clip_drive_link,
+        )
         await state.finish()
 
+        if clip_video_file_id:
+            status = await message.answer(f"⏳ Клип #{job.clip_id} принят — загружаю на диск, сообщу, когда будет готово")
+            job.status_message = (status.chat.id, status.message_id)
+        else:
+            await message.answer(f"✅ Клип #{job.clip_id} отправлен на модерацию!")
+
+        await clip_pipeline.submit(job)
+        logging.info(f"🎬 Клип #{job.clip_id} от {job.nick or user_id} в очереди "
+                     f"({'файл' if clip_video_file_id else 'ссылка'})")
+
     except Exception as e:
         logging.error(f"❌ finalize_clip_submission: {type(e).__name__}: {e}")
         await message.answer("❌ Ошибка отправки. Попробуйте ещё раз")
         await state.finish()
+
+
+# =========================
+# 🎬 КОНВЕЙЕР КЛИПОВ: шаги после загрузки на диск
+# =========================
+async def clip_add_sheet_row(job: ClipJob):
+    """Строка в листе «клипы» со статусом «на модерации»"""
+    def append():
+        get_clips_sheet().append_row([
+            job.clip_id, job.nick, job.username, str(job.user_id),
+            job.drive_link, (job.drive or {}).get('file_id', ''), job.description,
+            get_msk_time().strftime("%d.%m.%Y %H:%M"), "на модерации", "", ""
+        ])
+    await asyncio.to_thread(append)
+
+
+async def clip_notify_moderators(job: ClipJob):
+    keyboard = InlineKeyboardMarkup(row_width=2).add(
+        InlineKeyboardButton("✅ Одобрить", callback_data=f"clip_approve_{job.clip_id}"),
+        InlineKeyboardButton("❌ Отклонить", callback_data=f"clip_reject_{job.clip_id}")
+    )
+    text = (
+        f"🎬 <b>Новый клип #{job.clip_id}</b>\n\n"
+        f"👤 {html_lib.escape(job.nick)} (@{html_lib.escape(job.username)})\n"
+        f"📝 {html_lib.escape(job.description) or '—'}\n"
+        f"🔗 {html_lib.escape(job.drive_link)}"
+    )
+    # При повторе шлём только тем, до кого не дошло, — у остальных кнопки уже есть
+    missing = [admin_id for admin_id in ADMINS if admin_id not in job.notified]
+    results = await gateway.fan_out(missing, text, priority=PRIORITY_ALERT,
+                                    reply_markup=keyboard, parse_mode="HTML")
+    job.notified.update(admin_id for admin_id, error in results.items() if error is None)
+    failed = [admin_id for admin_id, error in results.items() if error is not None]
+    if failed:
+        raise RuntimeError(f"сообщение о клипе не доставлено админам: {failed}")
+
+
+clip_pipeline.set_bot(bot)
+clip_pipeline.add_step('sheet', clip_add_sheet_row)
+clip_pipeline.add_step('moderation', clip_notify_moderators)
 # =========================
 # 🎬 АДМИН: МОДЕРАЦИЯ КЛИПОВ (ссылка на диск уже есть)
 # =========================
@@ -901,11 +1025,12 @@ async def approve_clip(callback: types.CallbackQuery):
 
         # Уведомляем пользователя
         try:
-            await bot.send_message(
+            await gateway.send_message(
                 int(user_tg_id),
                 f"✅ Ваш клип #{clip_id} одобрен! 🎉\n\n"
                 f"🔗 Ссылка: {drive_link}\n\n"
-                f"Спасибо за контент! 🎮"
+                f"Спасибо за контент! 🎮",
+                priority=PRIORITY_ALERT
             )
         except:
             pass  # Пользователь мог заблокировать бота
@@ -956,10 +1081,11 @@ async def reject_clip(callback: types.CallbackQuery):
 
         # Уведомляем пользователя
         try:
-            await bot.send_message(
+            await gateway.send_message(
                 int(user_tg_id),
                 f"❌ Ваш клип #{clip_id} не прошёл модерацию.\n"
-                f"Попробуйте отправить другой момент! 🎮"
+                f"Попробуйте отправить другой момент! 🎮",
+                priority=PRIORITY_ALERT
             )
         except:
             pass
@@ -1079,13 +1205,14 @@ async def mute_via_reply(message: types.Message):
 
         # 🔹 Уведомляем нарушителя в ЛС
         try:
-            await bot.send_message(
+            await gateway.send_message(
                 violator_id,
                 f"🔇 Вам выдан мут в чате клана PET\n"
                 f"🕒 Длительность: {duration_readable}\n"
                 f"📝 Причина: {reason}\n"
                 f"🛡 Модератор: {moderator_nick}",
-                parse_mode="HTML"
+                parse_mode="HTML",
+                priority=PRIORITY_ALERT
             )
         except:
             pass  # Пользователь мог заблокировать бота
@@ -1332,28 +1459,23 @@ async def app_submit(callback: types.CallbackQuery, state: FSMContext):
 
         await state.finish()
 
-        for admin_id in ADMINS:
-            try:
-                kb = InlineKeyboardMarkup(row_width=2)
-                kb.add(InlineKeyboardButton("✅ Принять", callback_data=f"app_accept_{app_id}"),
-                       InlineKeyboardButton("❌ Отклонить", callback_data=f"app_reject_{app_id}"))
-
-                await bot.send_message(
-                    admin_id,
-                    f"📬 Новая заявка!\n"
-                    f"🆔 #{app_id}\n"
-                    f"🎮 <code>{steam_nick}</code>\n"
-                    f"🆔 <code>{steam_id}</code>\n"
-                    f"🎂 {age} лет | ⏰ {prime_time}\n"
-                    f"🎖 Роль: {preferred_role}\n"
-                    f"🎮 Игры: {other_games}\n"
-                    f"📝 О себе: {about_me}\n"
-                    f"👤 {tg_username}\n"
-                    f"🆔 <code>{tg_id}</code>",
-                    reply_markup=kb, parse_mode="HTML"
-                )
-            except Exception as e:
-                logging.error(f"❌ Ошибка уведомления админа: {e}")
+        kb = InlineKeyboardMarkup(row_width=2)
+        kb.add(InlineKeyboardButton("✅ Принять", callback_data=f"app_accept_{app_id}"),
+               InlineKeyboardButton("❌ Отклонить", callback_data=f"app_reject_{app_id}"))
+        notify_admins(
+            f"📬 Новая заявка!\n"
+            f"🆔 #{app_id}\n"
+            f"🎮 <code>{steam_nick}</code>\n"
+            f"🆔 <code>{steam_id}</code>\n"
+            f"🎂 {age} лет | ⏰ {prime_time}\n"
+            f"🎖 Роль: {preferred_role}\n"
+            f"🎮 Игры: {other_games}\n"
+            f"📝 О себе: {about_me}\n"
+            f"👤 {tg_username}\n"
+            f"🆔 <code>{tg_id}</code>",
+            tag="заявка",
+            reply_markup=kb, parse_mode="HTML"
+        )
 
         await callback.message.edit_text(
             f"✅ Заявка отправлена!\n📋 ID: <code>#{app_id}</code>\nОжидайте решения модераторов!",
@@ -1564,95 +1686,19 @@ import traceback
 import re
 from datetime import datetime
 from krestgg_parser import parser as krest_parser
-import requests
 
 @dp.message_handler(commands=['pet_online', 'пет_онлайн', 'клан_онлайн'])
 async def cmd_pet_online(message: types.Message):
-    """🔍 Парсер SQStat — inline версия"""
+    """🔍 Онлайн клана с SQStat — из кэша clan_online"""
     status = await message.answer("🔍 Сканирую сервера Protocol...")
 
     try:
-        found = []
-        api_url = "https://prot.proxy.sqstat.ru/ajax/clan.php"
+        full_text = await clan_online.get_message()
 
-        headers = {
-            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-            'X-Requested-With': 'XMLHttpRequest',
-            'Origin': 'https://prot.proxy.sqstat.ru',
-            'Referer': 'https://prot.proxy.sqstat.ru/clan/52',
-            'User-Agent': 'Mozilla/5.0'
-        }
-        PROTOCOL_NAMES = {
-            '5': 'Проткол AAS/RAAS',
-            '10': 'Проткол Инвага',
-            '11': 'Проткол Супермод',
-            '12': 'Проткол ВС РФ VS ВСУ',
-        }
-
-        data = {'clan_id': '52', 'action': 'list'}
-
-        # 🔹 Синхронный запрос (для простоты)
-        resp = requests.post(api_url, headers=headers, data=data, timeout=10)
-        resp.encoding = 'utf-8'
-        json_data = resp.json()
-
-        servers = json_data.get('servers', {})
-
-        for server_id, players_obj in servers.items():
-            if not players_obj or isinstance(players_obj, list):
-                continue
-
-            if server_id in PROTOCOL_NAMES:
-                server_name = PROTOCOL_NAMES[server_id]
-            else:
-                server_name = f"Protocol #{server_id}"
-
-            for player_id, player_data in players_obj.items():
-                name = player_data.get('name', '')
-                # Фильтр по PET/РЕТ
-                if ('PET' in name.upper() or 'РЕТ' in name.upper()) and name and len(name) < 50:
-                    found.append({'server': server_name, 'nick': name})
-                    logger.debug(f"[SQStat] {server_name} → {name}")
-
-        if not found:
+        if not full_text:
             await status.edit_text("🔴 Сейчас нет игроков [PET] в сети или сайт не ответил.")
             return
 
-        # 🔹 Группируем по серверам
-        from collections import defaultdict
-        servers_grouped = defaultdict(list)
-        for p in found:
-            servers_grouped[p['server']].append(p['nick'])
-
-        lines = ["🟢 <b>Клан [PET] по серверам Protocol:</b>\n"]
-        total = 0
-
-        for server, players_list in servers_grouped.items():
-            count = len(players_list)
-            if count == 0:
-                continue
-            total += count
-            srv_clean = server.replace("Protocol ", "").strip()
-            lines.append(f"🎮 <b>{server_name}</b> ({count}): ")
-
-            # Чистим ники от тегов
-            clean_nicks = []
-            for nick in players_list:
-                cleaned = re.sub(r'[\[\(]?[|]?\s*(?:PET|РЕТ)[sS tTpP]?\s*[|\]]?[\)]?\s*', '', nick, flags=re.I).strip()
-                if cleaned and len(cleaned) < 50:
-                    clean_nicks.append(cleaned)
-
-            # Группируем по 5 в строку
-            for i in range(0, len(clean_nicks), 5):
-                chunk = clean_nicks[i:i + 5]
-                nick_str = "  •  ".join(f"<code>{html_lib.escape(n)}</code>" for n in chunk if n)
-                if nick_str:
-                    lines.append("  •  " + nick_str)
-            lines.append("")
-
-        lines.append(f"📊 <i>Всего онлайн: {total} | Обновлено: {get_msk_time().strftime('%H:%M:%S')}</i>")
-
-        full_text = "\n".join(lines)
         if len(full_text) > 4096:
             await status.edit_text(full_text[:4090] + "\n\n...")
         else:
@@ -1664,6 +1710,150 @@ async def cmd_pet_online(message: types.Message):
             "⚠️ Произошла ошибка при опросе серверов.\nПроверь логи или попробуй позже.",
             parse_mode="HTML"
         )
+online_aggregator.set_roster_loader(get_clan_members)
+
+
+@dp.message_handler(commands=['online_all', 'онлайн'])
+async def cmd_online_all(message: types.Message):
+    """🌐 Общий онлайн клана: sqstat + krestgg"""
+    try:
+        view = await online_aggregator.get_view()
+        text = render_online_view(view)
+        if not text:
+            await message.answer("🔴 Сейчас нет игроков [PET] в сети")
+            return
+        if len(text) > 4096:
+            text = text[:4090] + "\n\n..."
+        await message.answer(text, parse_mode="HTML")
+    except Exception as e:
+        logger.error(f"❌ cmd_online_all: {e}")
+        await message.answer("⚠️ Не удалось собрать онлайн, попробуй позже")
+
+
+# =========================
+# 🗓 ЖУРНАЛ ПРИСУТСТВИЯ
+# =========================
+PRESENCE_MAX_AGE = 180  # старее — источник считается молчащим, отсчёт не пишем
+
+
+async def record_presence_job():
+    """Задача планировщика: отсчёт «кто в сети» из кэшей sqstat и krestgg"""
+    try:
+        now = time.time()
+        sqstat_snapshot = clan_online.peek_snapshot()
+        if sqstat_snapshot and now - sqstat_snapshot['fetched_at'] > PRESENCE_MAX_AGE:
+            sqstat_snapshot = None
+        krest_max_age = max(PRESENCE_MAX_AGE, krest_parser.current_ttl() * 2)
+        krest_snapshot = {sid: e for sid, e in krest_parser.snapshot().items()
+                          if now - e['updated_at'] <= krest_max_age}
+
+        await online_aggregator.refresh_roster()
+        view = online_aggregator.build_view(sqstat_snapshot, krest_snapshot)
+        presence_log.append_sample(int(now), [(p['servers'][0], p['member'] or p['nick']) for p in view['players']])
+        presence_log.flush()
+    except Exception as e:
+        logging.error(f"❌ record_presence_job: {e}")
+
+
+def _presence_days(message: types.Message, default: int = 7) -> int:
+    arg = message.get_args().strip()
+    return max(1, min(int(arg), 90)) if arg.isdigit() else default
+
+
+@dp.message_handler(commands=['last_seen', 'был_в_сети'])
+async def cmd_last_seen(message: types.Message):
+    nick = message.get_args().strip()
+    if not nick:
+        await message.answer("❓ Использование: /last_seen ник")
+        return
+    seen = presence_log.last_seen(nick)
+    if not seen:
+        await message.answer(f"🔍 <code>{html_lib.escape(nick)}</code> в журнале не найден", parse_mode="HTML")
+        return
+    ts, server, name = seen
+    when = datetime.fromtimestamp(ts, pytz.timezone("Europe/Moscow")).strftime("%d.%m.%Y %H:%M")
+    await message.answer(f"🕒 <b>{html_lib.escape(name)}</b> был в сети {when} МСК\n🎮 {html_lib.escape(server)}",
+                         parse_mode="HTML")
+
+
+@dp.message_handler(commands=['peak_hours', 'прайм'])
+async def cmd_peak_hours(message: types.Message):
+    """📈 Средний онлайн клана по часам за N дней: /peak_hours [дней]"""
+    days = _presence_days(message)
+    now = int(time.time())
+    heat = presence_log.heatmap(now - days * 86400, now)
+    peak = max(heat)
+    if peak <= 0:
+        await message.answer("📭 Данных за этот период пока нет")
+        return
+    lines = [f"📈 <b>Средний онлайн по часам (МСК), {days} дн.</b>\n"]
+    for hour, value in enumerate(heat):
+        bar = "█" * round(value / peak * 12)
+        lines.append(f"<code>{hour:02d}:00 {bar:<12} {value:.1f}</code>")
+    await message.answer("\n".join(lines), parse_mode="HTML")
+
+
+@dp.message_handler(commands=['who_played', 'кто_играл'])
+async def cmd_who_played(message: types.Message):
+    """🎮 Кто играл за N дней и сколько: /who_played [дней]"""
+    days = _presence_days(message)
+    now = int(time.time())
+    rows = presence_log.player_minutes(now - days * 86400, now)
+    if not rows:
+        await message.answer("📭 Данных за этот период пока нет")
+        return
+    minutes_per_sample = PRESENCE_SAMPLE_INTERVAL / 60
+    lines = [f"🎮 <b>Кто играл за {days} дн.: {len(rows)}</b>\n"]
+    for i, (nick, samples) in enumerate(rows[:30], 1):
+        hours = samples * minutes_per_sample / 60
+        lines.append(f"{i}. {html_lib.escape(nick)} — <code>{hours:.1f} ч</code>")
+    await message.answer("\n".join(lines), parse_mode="HTML")
+
+
+@dp.message_handler(commands=['online_sub', 'подписка_онлайн'])
+async def cmd_online_subscribe(message: types.Message):
+    """🔔 Вкл/выкл уведомления о заходе соклановцев"""
+    try:
+        nickname = find_member_by_tg_id(message.from_user.id)
+        if not nickname:
+            await message.answer("❌ Подписка доступна только участникам клана")
+            return
+        if toggle_online_subscription(message.from_user.id, nickname):
+            await message.answer("🔔 Подписка включена — напишу, когда соклановцы зайдут на сервер.\n"
+                                 "Отключить: /online_sub")
+        else:
+            await message.answer("🔕 Подписка на онлайн отключена")
+    except Exception as e:
+        logging.error(f"❌ cmd_online_subscribe: {e}")
+        await message.answer("⚠️ Не удалось изменить подписку, попробуй позже")
+
+
+async def notify_online_subscribers(diff: dict):
+    """Слушатель clan_online: рассылает подписчикам, кто из клана зашёл в игру"""
+    if not diff['joined']:
+        return
+    subscribers = get_online_subscribers()
+    if not subscribers:
+        return
+
+    grouped = {}
+    for p in diff['joined']:
+        grouped.setdefault(p['server'], []).append(clean_nick(p['nick']))
+    joined_nicks = {n for nicks in grouped.values() for n in nicks}
+
+    lines = ["🟢 <b>Соклановцы зашли в игру:</b>"]
+    for server, nicks in grouped.items():
+        lines.append(f"🎮 {server}: " + ", ".join(f"<code>{html_lib.escape(n)}</code>" for n in nicks))
+    text = "\n".join(lines)
+
+    # Не сообщаем человеку о его собственном заходе, если больше никто не зашёл
+    recipients = [tg_id for tg_id, nick in subscribers.items() if joined_nicks - {nick.strip()}]
+    if recipients:
+        notify_in_background(recipients, text, tag="онлайн", priority=PRIORITY_BROADCAST,
+                             timeout=None, parse_mode="HTML")
+
+
+clan_online.add_listener(notify_online_subscribers)
 # =========================
 # 📬 АДМИН-ПАНЕЛЬ ЗАЯВОК
 # =========================
@@ -1772,9 +1962,10 @@ async def app_accept(callback: types.CallbackQuery):
 
         if add_new_member(app['nick'], app['steam_id'], app['tg_username'], app['tg_id']):
             try:
-                await bot.send_message(
+                await gateway.send_message(
                     int(app['tg_id']),
-                    f"🎉 Заявка принята!\nДобро пожаловать в PET!\n🔗 {GROUP_LINK}"
+                    f"🎉 Заявка принята!\nДобро пожаловать в PET!\n🔗 {GROUP_LINK}",
+                    priority=PRIORITY_ALERT
                 )
             except:
                 pass
@@ -1814,9 +2005,10 @@ async def app_reject(callback: types.CallbackQuery):
         update_application_status(app_id, "отклонен")
 
         try:
-            await bot.send_message(
+            await gateway.send_message(
                 int(app['tg_id']),
-                "❌ Заявка отклонена\nПопробуйте через 7 дней."
+                "❌ Заявка отклонена\nПопробуйте через 7 дней.",
+                priority=PRIORITY_ALERT
             )
         except:
             pass
@@ -1874,126 +2066,52 @@ async def apps_archive(callback: types.CallbackQuery):
 
 
 # =========================
-# 📊 SQSTAT PARSER
+# 🏅 ЛИДЕРБОРД SQSTAT
 # =========================
-async def fetch_sqstat_profile(steam_id: str) -> dict | None:
-    """Парсит статистику с breaking.proxy.sqstat.ru/player/{steam_id}"""
-    import aiohttp
-    from bs4 import BeautifulSoup
-    import re
+LEADERBOARD_ALIASES = {'kd': 'kd', 'кд': 'kd', 'wr': 'winrate', 'винрейт': 'winrate',
+                       'time': 'playtime', 'время': 'playtime'}
 
-    url = f"https://breaking.proxy.sqstat.ru/player/{steam_id}"
-
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=15, headers={
-                "User-Agent": "Mozilla/5.0"
-            }) as response:
-                if response.status != 200:
-                    return None
-                html = await response.text()
-
-        soup = BeautifulSoup(html, 'lxml')
-        stats = {}
-        text_content = soup.get_text(separator='\n', strip=True)
-        lines = [l.strip() for l in text_content.split('\n') if l.strip()]
-
-        # 🔹 Улучшенная функция поиска числовых значений
-        def find_numeric_value(label: str, allow_percent: bool = False):
-            """Ищет числовое значение после метки, игнорируя буквы типа 'м'"""
-            # Паттерн: метка + разделители + число (с запятыми/точками/процентами)
-            percent_pattern = r'[\d\s,]+\.?\d*%' if allow_percent else r'[\d\s,]+\.?\d*'
-            pattern = rf'{re.escape(label)}\s*[:\s\n]*\s*({percent_pattern})'
-            match = re.search(pattern, text_content, re.IGNORECASE)
-            if match:
-                raw = match.group(1).strip()
-                # Очищаем и проверяем, что это действительно число
-                cleaned = re.sub(r'[^\d.,%]', '', raw)
-                if cleaned and (cleaned.replace('.', '').replace(',', '').replace('%', '').isdigit()):
-                    return cleaned.replace(',', '.')  # нормализуем разделитель
-            return None
-
-        # 🔹 Функция для поиска любого значения (если нужно не только число)
-        def find_any_value(label: str):
-            pattern = rf'{re.escape(label)}\s*[:\s\n]*\s*([^\n]+?)(?:\n|$)'
-            match = re.search(pattern, text_content, re.IGNORECASE)
-            return match.group(1).strip() if match and match.group(1).strip() else None
-
-        # 🔹 Ключевые метрики (только числа)
-        stats['kd'] = find_numeric_value('К/Д')  # может быть 0.69
-        stats['winrate'] = find_numeric_value('Винрейт', allow_percent=True)  # 54.1%
-        stats['kills'] = find_numeric_value('УБИЙСТВА')
-        stats['deaths'] = find_numeric_value('СМЕРТИ')
-        stats['damage'] = find_numeric_value('УРОН')
-        stats['revives'] = find_numeric_value('ПОДНЯТИЯ')
-        stats['matches'] = find_numeric_value('МАТЧЕЙ')
-        stats['wins'] = find_numeric_value('ПОБЕД')
-        stats['losses'] = find_numeric_value('ПРОИГРЫШЕЙ')
-
-        # 🔹 Время в игре (может быть в минутах или формате "2645")
-        raw_playtime = find_numeric_value('ОНЛАЙН')
-        if raw_playtime:
-            try:
-                total_minutes = int(float(raw_playtime.replace(',', '.')))
-                hours = total_minutes // 60
-                minutes = total_minutes % 60
-                stats['playtime'] = f"{hours}ч {minutes:02d}м" if hours > 0 else f"{minutes}м"
-            except:
-                stats['playtime'] = raw_playtime  # fallback если не получилось конвертировать
+
+async def sqstat_leaderboard_job():
+    """Задача планировщика: дообновляет порцию самых старых профилей"""
+    try:
+        await sqstat_leaderboard.refresh(get_members_steam_ids())
+    except Exception as e:
+        logging.error(f"❌ sqstat_leaderboard_job: {e}")
+
+
+@dp.message_handler(commands=['top_stats', 'топ_стата'])
+async def cmd_top_stats(message: types.Message):
+    """🏅 Рейтинг клана по sqstat: /top_stats [kd|wr|time]"""
+    arg = message.get_args().strip().lower() or 'kd'
+    metric = LEADERBOARD_ALIASES.get(arg)
+    if not metric:
+        await message.answer("❓ Использование: /top_stats [kd | wr | time]")
+        return
+
+    rows = sqstat_leaderboard.ranking(metric, limit=10)
+    if not rows:
+        await message.answer("📭 Рейтинг ещё собирается — загляни чуть позже")
+        return
+
+    field, title = LEADERBOARD_METRICS[metric]
+    lines = [f"🏅 <b>Топ клана — {title}</b>\n"]
+    for i, row in enumerate(rows, 1):
+        value = row[field]
+        if metric == 'playtime':
+            shown = f"{value // 60}ч"
+        elif metric == 'winrate':
+            shown = f"{value:.1f}%"
         else:
-            # Пробуем найти время в другом формате (например "44ч 05м")
-            alt_time = find_any_value('ОНЛАЙН')
-            if alt_time and any(c.isdigit() for c in alt_time):
-                stats['playtime'] = alt_time[:20]  # обрезаем если слишком длинное
-
-        # 🔹 Топ оружие (ищем строки с названием оружия + числом убийств)
-        weapons = []
-        weapon_names = ['M16A4', 'M4A1', 'AK-12', 'AKM', 'SCAR-H', 'QBZ-03', 'AUG-A3', 'MP7', 'M249', 'PKM']
-        for line in lines:
-            for wname in weapon_names:
-                if wname.lower() in line.lower():
-                    # Ищем число в этой же строке или следующей
-                    nums = re.findall(r'[\d]+', line)
-                    if nums:
-                        weapons.append({'name': wname, 'kills': nums[-1]})
-                    break
-            if len(weapons) >= 3:
-                break
-        stats['top_weapons'] = weapons
-
-        # 🔹 Последние матчи (карты)
-        matches = []
-        seen_maps = set()
-        for line in lines:
-            # Фильтр по известным картам Squad
-            if any(m in line for m in
-                   ['Gorodok', 'Breakwater', 'Lashkar', 'Khanji', 'Tallil', 'Yehorivka', 'Fallujah']):
-                if line[:30] not in seen_maps:  # избегаем дублей
-                    result = "⚪"
-                    # Ищем результат в соседних строках
-                    idx = lines.index(line) if line in lines else -1
-                    if idx >= 0:
-                        context = ' '.join(lines[max(0, idx - 2):min(len(lines), idx + 3)]).lower()
-                        if any(x in context for x in ['победа', 'да', 'выигрыш']):
-                            result = "✅"
-                        elif any(x in context for x in ['пораж', 'нет', 'проигр']):
-                            result = "❌"
-                    matches.append({'map': line[:30], 'result': result})
-                    seen_maps.add(line[:30])
-            if len(matches) >= 3:
-                break
-        stats['recent_matches'] = matches
+            shown = f"{value:.2f}"
+        lines.append(f"{i}. {html_lib.escape(row['nick'])} — <code>{shown}</code>")
+    await message.answer("\n".join(lines), parse_mode="HTML")
 
-        return stats
 
-    except Exception as e:
-        logging.error(f"❌ sqstat parse error: {e}")
-        return None
-            # Следующий элемент - количество убийств
 # =========================
 # 👤 ПРОФИЛЬ
 # =========================
-@dp.callback_query_handler(lambda c: c.data == "my_profile")
+@dp.callback_query_handler(lambda c: c.data in ("my_profile", "my_profile_refresh"))
 async def my_profile(callback: types.CallbackQuery):
     try:
         user_id = callback.from_user.id
@@ -2028,10 +2146,13 @@ async def my_profile(callback: types.CallbackQuery):
 
         # Если есть валидный Steam ID — пробуем подгрузить sqstat
         if steam_id and steam_id != 'N/A' and steam_id.isdigit():
-            text += "\n\n🔄 <i>Загружаю статистику с серверов...</i>"
-            loading_msg = await callback.message.edit_text(text, reply_markup=None, parse_mode="HTML")
+            # Есть кэш — рисуем сразу, без промежуточного «Загружаю»
+            loading_msg = callback.message
+            if sqstat_profile_cache.peek(steam_id)[0] is None:
+                text += "\n\n🔄 <i>Загружаю статистику с серверов...</i>"
+                loading_msg = await callback.message.edit_text(text, reply_markup=None, parse_mode="HTML")
 
-            sqstats = await fetch_sqstat_profile(steam_id)
+            sqstats = await get_sqstat_profile(steam_id, force=callback.data == "my_profile_refresh")
 
             if sqstats:
                 sq_text = f"\n\n🌐 <b>Статистика с сервера:</b>\n"
@@ -2080,6 +2201,9 @@ async def my_profile(callback: types.CallbackQuery):
                     for m in matches[:3]:
                         sq_text += f"{m['result']} {html_lib.escape(m['map'])}\n"
 
+                updated = datetime.fromtimestamp(sqstats['fetched_at'], pytz.timezone("Europe/Moscow"))
+                sq_text += f"\n🕒 <i>Обновлено: {updated.strftime('%H:%M')}</i>"
+
                 text = text.replace("\n\n🔄 <i>Загружаю статистику с серверов...</i>", "") + sq_text
             else:
                 text = text.replace("\n\n🔄 <i>Загружаю статистику с серверов...</i>", "")
@@ -2091,12 +2215,15 @@ async def my_profile(callback: types.CallbackQuery):
             keyboard.add(InlineKeyboardButton("📜 Мои преды", callback_data="view_preds"))
             keyboard.add(InlineKeyboardButton("👏 Мои похвалы", callback_data="view_praises"))
             keyboard.row(
-                InlineKeyboardButton("🔄 Обновить", callback_data="my_profile"),
+                InlineKeyboardButton("🔄 Обновить", callback_data="my_profile_refresh"),
                 InlineKeyboardButton("🌐 Sqstat", url=f"https://breaking.proxy.sqstat.ru/player/{steam_id}")
             )
             keyboard.add(InlineKeyboardButton("🏠 В меню", callback_data="back_menu"))
 
-            await loading_msg.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+            try:
+                await loading_msg.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+            except MessageNotModified:
+                pass  # «Обновить» в пределах минуты — данные те же
         else:
             # Нет валидного Steam ID — показываем профиль без sqstat
             keyboard = InlineKeyboardMarkup(row_width=1)
@@ -2418,15 +2545,7 @@ async def process_reason(message: types.Message, state: FSMContext):
 
                 )
 
-                for admin_id in ADMINS:
-
-                    try:
-
-                        await bot.send_message(admin_id, notify_text, reply_markup=kb, parse_mode="HTML")
-
-                    except Exception as e:
-
-                        logging.warning(f"❌ Не удалось уведомить админа {admin_id}: {e}")
+                notify_admins(notify_text, tag="жалоба", reply_markup=kb, parse_mode="HTML")
 
             except Exception as e:
 
@@ -2480,7 +2599,7 @@ async def process_proof(message: types.Message, state: FSMContext):
         admin_id = data.get("admin_id")
         if admin_id:
             try:
-                await bot.send_message(admin_id, f"📬 Доказательства по жалобе #{idx}\n{proof}")
+                await gateway.send_message(admin_id, f"📬 Доказательства по жалобе #{idx}\n{proof}", priority=PRIORITY_ALERT)
             except:
                 pass
         await message.answer("✅ Доказательства приняты")
@@ -2528,22 +2647,16 @@ async def process_court_reason(message: types.Message, state: FSMContext):
             f"🔗 Ссылка: {discord_link}"
         )
 
-        # Отправка игроку
+        # 📝 ЛОГГИРОВАНИЕ В ТАБЛИЦУ "логи"
+        append_log("ВЫЗОВ_В_СУД", message.from_user.full_name, message.from_user.id, f"{member} | {time_str}")
+
+        # Отправка игроку (фоном)
         if tg_id and tg_id.isdigit():
-            try:
-                await bot.send_message(int(tg_id), player_text, parse_mode="HTML")
-            except Exception as e:
-                logging.warning(f"⚠️ Не удалось отправить вызов {member}: {e}")
+            notify_in_background([int(tg_id)], player_text, tag=f"суд → {member}", parse_mode="HTML")
 
         # 🔔 Уведомление всем админам
         admin_notify = f"✅ <b>{member}</b> вызван в суд.\n🕒 {time_str}\n📝 {reason}\n🛡 Инициатор: {admin_info}"
-        for admin_id in ADMINS:
-            try:
-                await bot.send_message(admin_id, admin_notify, parse_mode="HTML")
-            except: pass
-
-        # 📝 ЛОГГИРОВАНИЕ В ТАБЛИЦУ "логи"
-        append_log("ВЫЗОВ_В_СУД", message.from_user.full_name, message.from_user.id, f"{member} | {time_str}")
+        notify_admins(admin_notify, tag="суд", parse_mode="HTML")
 
         # Возврат в главное меню
         existing_nick = find_member_by_tg_id(message.from_user.id)
@@ -2785,59 +2898,68 @@ async def finalize_notification(message: types.Message, state: FSMContext):
         sent_count = 0
         failed_count = 0
 
-        for user_id in recipients:
-            try:
-                if photo_file_id:
-                    await bot.send_photo(
-                        chat_id=user_id,
-                        photo=photo_file_id,
-                        caption=f"📢 <b>Оповещение</b>\n\n{text}",
-                        parse_mode="HTML"
-                    )
-                else:
-                    await bot.send_message(
-                        chat_id=user_id,
-                        text=f"📢 <b>Оповещение</b>\n\n{text}",
-                        parse_mode="HTML"
-                    )
-                sent_count += 1
-                await asyncio.sleep(0.1)
-            except Exception as e:
-                logging.error(f"❌ Ошибка отправки {user_id}: {e}")
+        # Ставим всю рассылку в нижнюю полосу очереди — темп задаёт шлюз
+        async def send_one(user_id):
+            if photo_file_id:
+                await gateway.send_photo(
+                    chat_id=user_id,
+                    photo=photo_file_id,
+                    caption=f"📢 <b>Оповещение</b>\n\n{text}",
+                    parse_mode="HTML",
+                    priority=PRIORITY_BROADCAST
+                )
+            else:
+                await gateway.send_message(
+                    chat_id=user_id,
+                    text=f"📢 <b>Оповещение</b>\n\n{text}",
+                    parse_mode="HTML",
+                    priority=PRIORITY_BROADCAST
+                )
+
+        results = await asyncio.gather(*(send_one(uid) for uid in recipients), return_exceptions=True)
+        for user_id, res in zip(recipients, results):
+            if isinstance(res, Exception):
+                logging.error(f"❌ Ошибка отправки {user_id}: {res}")
                 failed_count += 1
+            else:
+                sent_count += 1
 
         # Отправка в тему группы (если всем)
         if audience == "all" and REPORT_CHAT_ID:
             try:
                 if photo_file_id:
                     if REPORT_TOPIC_ID and REPORT_TOPIC_ID.isdigit():
-                        await bot.send_photo(
+                        await gateway.send_photo(
                             chat_id=REPORT_CHAT_ID,
                             photo=photo_file_id,
                             caption=f"📢 <b>Оповещение для всех</b>\n\n{text}",
                             parse_mode="HTML",
-                            message_thread_id=int(WARN_CHAT_ID)
+                            message_thread_id=int(WARN_CHAT_ID),
+                            priority=PRIORITY_BROADCAST
                         )
                     else:
-                        await bot.send_photo(
+                        await gateway.send_photo(
                             chat_id=REPORT_CHAT_ID,
                             photo=photo_file_id,
                             caption=f"📢 <b>Оповещение для всех</b>\n\n{text}",
-                            parse_mode="HTML"
+                            parse_mode="HTML",
+                            priority=PRIORITY_BROADCAST
                         )
                 else:
                     if REPORT_TOPIC_ID and REPORT_TOPIC_ID.isdigit():
-                        await bot.send_message(
+                        await gateway.send_message(
                             chat_id=REPORT_CHAT_ID,
                             text=f"📢 <b>Оповещение для всех</b>\n\n{text}",
                             parse_mode="HTML",
-                            message_thread_id=int(WARN_CHAT_ID)
+                            message_thread_id=int(WARN_CHAT_ID),
+                            priority=PRIORITY_BROADCAST
                         )
                     else:
-                        await bot.send_message(
+                        await gateway.send_message(
                             chat_id=REPORT_CHAT_ID,
                             text=f"📢 <b>Оповещение для всех</b>\n\n{text}",
-                            parse_mode="HTML"
+                            parse_mode="HTML",
+                            priority=PRIORITY_BROADCAST
                         )
             except Exception as e:
                 logging.error(f"❌ Ошибка отправки в группу: {e}")
@@ -3149,7 +3271,7 @@ async def complaint_actions(callback: types.CallbackQuery):
             close_complaint(idx, closed_by=admin_info)
             if sender_id:
                 try:
-                    await bot.send_message(int(sender_id), f"✅ Жалоба на {violator} рассмотрена. Выдан ПРЕД.", parse_mode="HTML")
+                    await gateway.send_message(int(sender_id), f"✅ Жалоба на {violator} рассмотрена. Выдан ПРЕД.", parse_mode="HTML", priority=PRIORITY_ALERT)
                 except:
                     pass
             user_id = callback.from_user.id
@@ -3174,7 +3296,7 @@ async def complaint_actions(callback: types.CallbackQuery):
                 try:
                     await dp.storage.set_state(chat=int(sender_id), user=int(sender_id), state=ActionState.waiting_proof)
                     await dp.storage.set_data(chat=int(sender_id), user=int(sender_id), data={"complaint_index": idx, "admin_id": callback.from_user.id})
-                    await bot.send_message(int(sender_id), f"🔍 Запрошены доказательства по жалобе на {target}.", parse_mode="HTML")
+                    await gateway.send_message(int(sender_id), f"🔍 Запрошены доказательства по жалобе на {target}.", parse_mode="HTML", priority=PRIORITY_ALERT)
                     await callback.answer("📩 Запрос отправлен", show_alert=True)
                 except Exception as e:
                     await callback.answer(f"❌ Ошибка: {e}", show_alert=True)
@@ -3195,7 +3317,7 @@ async def complaint_actions(callback: types.CallbackQuery):
             close_complaint(idx, closed_by=admin_info)
             if sender_id:
                 try:
-                    await bot.send_message(int(sender_id), f"ℹ️ Жалоба на {target} закрыта без санкций.", parse_mode="HTML")
+                    await gateway.send_message(int(sender_id), f"ℹ️ Жалоба на {target} закрыта без санкций.", parse_mode="HTML", priority=PRIORITY_ALERT)
                 except:
                     pass
             user_id = callback.from_user.id
@@ -3233,20 +3355,72 @@ async def test_report_cmd(message: types.Message):
         return
     report = generate_weekly_report()
     if REPORT_TOPIC_ID and REPORT_TOPIC_ID.isdigit():
-        await bot.send_message(
+        await gateway.send_message(
             chat_id=REPORT_CHAT_ID,
             text=report,
             parse_mode="HTML",
-            message_thread_id=int(REPORT_TOPIC_ID)
+            message_thread_id=int(REPORT_TOPIC_ID),
+            priority=PRIORITY_REPORT
         )
     else:
-        await bot.send_message(
+        await gateway.send_message(
             chat_id=REPORT_CHAT_ID,
             text=report,
-            parse_mode="HTML"
+            parse_mode="HTML",
+            priority=PRIORITY_REPORT
         )
     await message.answer("✅ Отчёт отправлен в группу!")
 
+@dp.message_handler(commands=["http_stats"])
+async def http_stats_cmd(message: types.Message):
+    """🔁 Эффективность условных запросов к sqstat"""
+    if message.from_user.id not in ADMINS:
+        return
+    stats = http_client.conditional_stats()
+    await message.answer(
+        f"🔁 <b>Условные HTTP-запросы</b>\n"
+        f"✅ 304 (без загрузки): <code>{stats['hits']}</code>\n"
+        f"⬇️ Полная загрузка: <code>{stats['misses']}</code>\n"
+        f"🚫 Без ETag/Last-Modified: <code>{stats['no_validators']}</code>\n"
+        f"📈 Hit rate: <code>{stats['hit_rate']:.0%}</code>\n"
+        f"🗂 URL в кэше: <code>{stats['entries']}</code>",
+        parse_mode="HTML"
+    )
+
+@dp.message_handler(commands=["breakers"])
+async def breakers_cmd(message: types.Message):
+    """🔌 Состояние предохранителей внешних сервисов"""
+    if message.from_user.id not in ADMINS:
+        return
+    lines = ["🔌 <b>Внешние сервисы</b>\n"]
+    for b in breaker_states():
+        line = f"{STATE_EMOJI[b['state']]} <b>{b['name']}</b> — {b['state']}"
+        if b['retry_in'] is not None:
+            line += f" (проба через {b['retry_in']:.0f} с)"
+        line += f"\n   вызовов {b['calls']}, ошибок {b['failures']}, отклонено {b['rejected']}, открывался {b['opened']}"
+        if b['last_latency'] is not None:
+            line += f"\n   последний ответ {b['last_latency']:.2f} с"
+        if b['last_error']:
+            line += f"\n   ⚠️ {html_lib.escape(b['last_error'])}"
+        lines.append(line)
+    await message.answer("\n".join(lines), parse_mode="HTML")
+
+@dp.message_handler(commands=["clips"])
+async def clips_stats_cmd(message: types.Message):
+    """🎬 Конвейер загрузки клипов на Drive"""
+    if message.from_user.id not in ADMINS:
+        return
+    stats = clip_pipeline.stats()
+    await message.answer(
+        f"🎬 <b>Конвейер клипов</b>\n"
+        f"⏳ В работе: <code>{stats['in_progress']}</code> (в очереди <code>{stats['queue']}</code>)\n"
+        f"📥 Принято: <code>{stats['queued']}</code>\n"
+        f"✅ Готово: <code>{stats['done']}</code>\n"
+        f"🔁 Повторов шагов: <code>{stats['retries']}</code>\n"
+        f"❌ Не удалось: <code>{stats['failed']}</code>",
+        parse_mode="HTML"
+    )
+
 @dp.message_handler(commands=["getid"])
 async def get_chat_id(message: types.Message):
     if message.from_user.id not in ADMINS:
@@ -3406,14 +3580,13 @@ async def process_ticket_message(message: types.Message, state: FSMContext):
             f"📝 {html_lib.escape(ticket_text)}"
         )
 
+        append_log("ТИКЕТ_СОЗДАН", username, user_id, ticket_text[:50])
+
         # Отправляем в группу модеров или админам в ЛС
         if MODS_CHAT_ID and MODS_CHAT_ID != 0:
-            await bot.send_message(MODS_CHAT_ID, mod_text, parse_mode="HTML")
+            notify_in_background([MODS_CHAT_ID], mod_text, tag="тикет", parse_mode="HTML")
         else:
-            for admin_id in ADMINS:
-                await bot.send_message(admin_id, mod_text, parse_mode="HTML")
-
-        append_log("ТИКЕТ_СОЗДАН", username, user_id, ticket_text[:50])
+            notify_admins(mod_text, tag="тикет", parse_mode="HTML")
         await message.answer("✅ Ваше обращение отправлено!\nОжидайте ответа в ЛС.")
         await state.finish()
     except Exception as e:
@@ -3451,7 +3624,7 @@ async def handle_mod_reply(message: types.Message):
         user_msg = f"🛡 <b>Модератор {mod_nick} ответил на ваш запрос:</b>\n\n{safe_reply}"
 
         try:
-            await bot.send_message(target_user_id, user_msg, parse_mode="HTML")
+            await gateway.send_message(target_user_id, user_msg, parse_mode="HTML")
             await message.answer("✅ Ответ успешно доставлен участнику!")
         except Exception as e:
             await message.answer(
@@ -3506,19 +3679,21 @@ async def check_new_devlogs():
 
             try:
                 if photo_url and photo_url.strip():
-                    await bot.send_photo(
+                    await gateway.send_photo(
                         chat_id=chat_id,
                         photo=photo_url,
                         caption=text,
                         parse_mode="HTML",
-                        message_thread_id=topic_id
+                        message_thread_id=topic_id,
+                        priority=PRIORITY_REPORT
                     )
                 else:
-                    await bot.send_message(
+                    await gateway.send_message(
                         chat_id=chat_id,
                         text=text,
                         parse_mode="HTML",
-                        message_thread_id=topic_id
+                        message_thread_id=topic_id,
+                        priority=PRIORITY_REPORT
                     )
                 ws.update_cell(idx, 8, "yes")
                 logging.info(f"✅ Девлог #{idx - 1} отправлен")
@@ -3538,12 +3713,29 @@ async def process_scheduled_notifications():
         logging.error(f"❌ process_scheduled_notifications: {e}")
 
 
+async def drive_token_job():
+    try:
+        await asyncio.to_thread(refresh_drive_credentials)
+    except Exception as e:
+        logging.error(f"❌ drive_token_job: {e}")
+
+
 async def on_startup(_):
     """Запускается при старте бота — ЕДИНАЯ ФУНКЦИЯ"""
     global scheduler
 
     logging.info("✅ Бот запущен, инициализация планировщика...")
 
+    # 📡 Шлюз исходящих сообщений живёт в loop бота
+    gateway.attach(bot, asyncio.get_running_loop())
+    # 🌐 Общая HTTP-сессия для sqstat и прочих внешних запросов
+    await http_client.start()
+    # 👷 Chromium для krestgg — в отдельном процессе, подальше от loop'ов бота и API
+    if KRESTGG_USE_WORKER:
+        krest_parser.use_worker(KrestGGWorkerClient())
+    # 🎬 Фоновая загрузка клипов на Drive
+    clip_pipeline.start()
+
     # Создаём планировщик с привязкой к текущему event loop
     from apscheduler.schedulers.asyncio import AsyncIOScheduler
     from apscheduler.triggers.cron import CronTrigger
@@ -3580,6 +3772,65 @@ async def on_startup(_):
         # )
         # logging.info("⏰ Задача 'check_notifications' добавлена")
 
+    # 👥 Фоновый опрос онлайна клана: /pet_online и Mini App читают готовый снапшот
+    scheduler.add_job(
+        clan_online.poll,
+        trigger=IntervalTrigger(seconds=ONLINE_POLL_INTERVAL),
+        id="clan_online_poll",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        next_run_time=datetime.now(pytz.timezone("Europe/Moscow"))
+    )
+    logging.info("⏰ Задача 'clan_online_poll' добавлена")
+
+    # 🛰 krestgg: сервера пересканируются фоном по адаптивному TTL, чтения скан не ждут
+    scheduler.add_job(
+        krest_parser.refresh,
+        trigger=IntervalTrigger(seconds=KRESTGG_REFRESH_INTERVAL),
+        id="krestgg_refresh",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        next_run_time=datetime.now(pytz.timezone("Europe/Moscow"))
+    )
+    logging.info("⏰ Задача 'krestgg_refresh' добавлена")
+
+    # 🗓 Поминутные отсчёты присутствия
+    scheduler.add_job(
+        record_presence_job,
+        trigger=IntervalTrigger(seconds=PRESENCE_SAMPLE_INTERVAL),
+        id="presence_sample",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    logging.info("⏰ Задача 'presence_sample' добавлена")
+
+    # ☁️ Токен Drive обновляется заранее — загрузка клипа не ждёт OAuth
+    if os.getenv("GDRIVE_CREDENTIALS_B64") or os.path.exists("credentials.json"):
+        scheduler.add_job(
+            drive_token_job,
+            trigger=IntervalTrigger(minutes=20),
+            id="drive_token_refresh",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+            next_run_time=datetime.now(pytz.timezone("Europe/Moscow"))
+        )
+        logging.info("⏰ Задача 'drive_token_refresh' добавлена")
+
+    # 🏅 Лидерборд sqstat: понемногу, начиная с самых старых записей
+    scheduler.add_job(
+        sqstat_leaderboard_job,
+        trigger=IntervalTrigger(seconds=LEADERBOARD_INTERVAL),
+        id="sqstat_leaderboard",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    logging.info("⏰ Задача 'sqstat_leaderboard' добавлена")
+
     # 🚀 Запускаем планировщик
     scheduler.start()
     logging.info("⏰ APScheduler запущен ✅")
@@ -3593,6 +3844,10 @@ async def on_shutdown(_):
         scheduler.shutdown(wait=True)
         logging.info("⏰ Планировщик остановлен")
 
+    await clip_pipeline.stop()
+    gateway.detach()
+    await krest_parser.close()
+    await http_client.close()
     await bot.close()
     logging.info("🔌 Бот закрыт")
 # =========================
@@ -0,0 +1,199 @@
+# circuit_breaker.py
+import time
+import asyncio
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+import gspread
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STATE_EMOJI = {CLOSED: "🟢", OPEN: "🔴", HALF_OPEN: "🟡"}
+
+
+class CircuitOpenError(Exception):
+    """Upstream помечен недоступным — запрос не отправлялся"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name}: предохранитель открыт, повтор через {retry_in:.0f} с")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для внешнего сервиса.
+    - closed: запросы идут, считаем подряд идущие ошибки и медленные ответы;
+    - open: после failure_threshold ошибок (или slow_threshold медленных ответов)
+      запросы сразу получают CircuitOpenError — вызывающий отдаёт кэш;
+    - half_open: через reset_timeout пропускается ровно один пробный запрос,
+      успех закрывает предохранитель, ошибка снова открывает.
+    Потокобезопасен: Google-запросы идут и из бота, и из API.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30,
+                 slow_call: Optional[float] = None, slow_threshold: int = 3,
+                 is_failure: Optional[Callable[[BaseException], bool]] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call = slow_call
+        self.slow_threshold = slow_threshold
+        self._is_failure = is_failure or (lambda e: True)
+
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self._failures = 0
+        self._slow = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._stats = {'calls': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+        self._last_error: Optional[str] = None
+        self._last_latency: Optional[float] = None
+
+    # =========================
+    # 🔌 СОСТОЯНИЕ
+    # =========================
+    def _before_call(self):
+        with self._lock:
+            if self.state == OPEN:
+                retry_in = self._opened_at + self.reset_timeout - time.monotonic()
+                if retry_in > 0:
+                    self._stats['rejected'] += 1
+                    raise CircuitOpenError(self.name, retry_in)
+                self.state = HALF_OPEN
+                logger.info(f"🟡 [{self.name}] Пробный запрос после паузы")
+            if self.state == HALF_OPEN:
+                if self._probe_in_flight:
+                    self._stats['rejected'] += 1
+                    raise CircuitOpenError(self.name, 0)
+                self._probe_in_flight = True
+            self._stats['calls'] += 1
+
+    def _open(self, reason: str):
+        if self.state != OPEN:
+            self._stats['opened'] += 1
+            logger.warning(f"🔴 [{self.name}] Предохранитель открыт: {reason}")
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def _on_success(self, latency: float):
+        with self._lock:
+            self._last_latency = latency
+            self._failures = 0
+            if self.slow_call is not None and latency > self.slow_call:
+                self._slow += 1
+                if self.state == HALF_OPEN or self._slow >= self.slow_threshold:
+                    self._open(f"медленные ответы ({latency:.1f} с)")
+                    return
+            else:
+                self._slow = 0
+            if self.state == HALF_OPEN:
+                logger.info(f"🟢 [{self.name}] Предохранитель закрыт")
+            self.state = CLOSED
+            self._probe_in_flight = False
+
+    def _on_failure(self, error: BaseException):
+        with self._lock:
+            self._stats['failures'] += 1
+            self._last_error = f"{type(error).__name__}: {error}"[:200]
+            self._failures += 1
+            if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._open(self._last_error)
+
+    def _release_probe(self):
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _finish(self, started: float, error: Optional[BaseException]):
+        if error is not None and self._is_failure(error):
+            self._on_failure(error)
+        else:
+            self._on_success(time.monotonic() - started)
+
+    # =========================
+    # 📞 ВЫЗОВЫ
+    # =========================
+    async def call(self, fn, *args, **kwargs):
+        """await fn(*args, **kwargs) через предохранитель"""
+        self._before_call()
+        started = time.monotonic()
+        try:
+            result = await fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            self._release_probe()
+            raise
+        except Exception as e:
+            self._finish(started, e)
+            raise
+        self._finish(started, None)
+        return result
+
+    def call_sync(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs) через предохранитель — для синхронных клиентов Google"""
+        self._before_call()
+        started = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._finish(started, e)
+            raise
+        self._finish(started, None)
+        return result
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+            return {
+                'name': self.name,
+                'state': self.state,
+                'consecutive_failures': self._failures,
+                'consecutive_slow': self._slow,
+                'retry_in': retry_in,
+                'last_error': self._last_error,
+                'last_latency': self._last_latency,
+                **self._stats,
+            }
+
+
+def _google_api_failure(error: BaseException) -> bool:
+    """4xx (кроме 429) — ошибка запроса, а не недоступность Google"""
+    if isinstance(error, gspread.exceptions.APIError):
+        status = getattr(error.response, 'status_code', 500)
+        return status >= 500 or status == 429
+    return not isinstance(error, gspread.exceptions.GSpreadException)
+
+
+def _drive_failure(error: BaseException) -> bool:
+    """Отказ Drive — сеть и 5xx/429; 4xx (истёкшая сессия, неверный запрос) — не недоступность"""
+    return getattr(error, 'retryable', True)
+
+
+breakers: Dict[str, CircuitBreaker] = {
+    'sqstat': CircuitBreaker('sqstat', failure_threshold=3, reset_timeout=30, slow_call=8),
+    'krestgg': CircuitBreaker('krestgg', failure_threshold=2, reset_timeout=120, slow_call=90, slow_threshold=2),
+    'google_sheets': CircuitBreaker('google_sheets', failure_threshold=5, reset_timeout=30, slow_call=10,
+                                    is_failure=_google_api_failure),
+    # Загрузка видео долгая по природе — без порога по задержке
+    'google_drive': CircuitBreaker('google_drive', failure_threshold=3, reset_timeout=60,
+                                   is_failure=_drive_failure),
+}
+
+
+def all_states() -> list:
+    return [breaker.snapshot() for breaker in breakers.values()]
+
+
+class GuardedSheetsClient(gspread.Client):
+    """gspread-клиент, все запросы которого идут через предохранитель google_sheets"""
+
+    def request(self, *args, **kwargs):
+        return breakers['google_sheets'].call_sync(super().request, *args, **kwargs)
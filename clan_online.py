@@ -0,0 +1,174 @@
+# clan_online.py
+import html
+import time
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+import pytz
+
+import http_client
+from circuit_breaker import breakers
+from swr_cache import SWRCache
+from nick_tags import has_tag, strip_tag
+
+logger = logging.getLogger(__name__)
+
+API_URL = "https://prot.proxy.sqstat.ru/ajax/clan.php"
+CLAN_ID = "52"
+HEADERS = {
+    'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+    'X-Requested-With': 'XMLHttpRequest',
+    'Origin': 'https://prot.proxy.sqstat.ru',
+    'Referer': f'https://prot.proxy.sqstat.ru/clan/{CLAN_ID}',
+    'User-Agent': 'Mozilla/5.0'
+}
+PROTOCOL_NAMES = {
+    '5': 'Проткол AAS/RAAS',
+    '10': 'Проткол Инвага',
+    '11': 'Проткол Супермод',
+    '12': 'Проткол ВС РФ VS ВСУ',
+}
+
+POLL_INTERVAL = 60       # период фонового опроса clan.php, сек
+ONLINE_TTL = 90          # свежесть снапшота (> POLL_INTERVAL — читатели не ходят в sqstat)
+ONLINE_STALE_TTL = 300   # сколько отдаём старый снапшот, пока идёт обновление
+SOFT_TIMEOUT = 3         # сколько ждём sqstat, если есть что показать
+REQUEST_TIMEOUT = 10
+
+class ClanOnlineService:
+    """Онлайн клана с sqstat (clan.php): кэш, single-flight и готовое сообщение"""
+
+    def __init__(self):
+        self._cache = SWRCache(ttl=ONLINE_TTL, stale_ttl=ONLINE_STALE_TTL, soft_timeout=SOFT_TIMEOUT)
+        self._rendered: Optional[dict] = None
+        self._rendered_text: Optional[str] = None
+        self._previous: Optional[dict] = None
+        self._listeners: List[Callable[[dict], Awaitable[None]]] = []
+
+    async def _fetch(self) -> dict:
+        # sqstat лежит — сразу ошибка, SWRCache отдаст последний снапшот
+        return await breakers['sqstat'].call(self._request)
+
+    async def _request(self) -> dict:
+        session = http_client.get_session()
+        async with session.post(API_URL, headers=HEADERS, data={'clan_id': CLAN_ID, 'action': 'list'},
+                                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)) as resp:
+            json_data = await resp.json(encoding='utf-8', content_type=None)
+
+        players = []
+        for server_id, players_obj in json_data.get('servers', {}).items():
+            if not players_obj or isinstance(players_obj, list):
+                continue
+            server_name = PROTOCOL_NAMES.get(server_id, f"Protocol #{server_id}")
+            for player_id, player_data in players_obj.items():
+                name = player_data.get('name', '')
+                # Фильтр по тегу клана — та же грамматика, что у krestgg (nick_tags)
+                if name and len(name) < 50 and has_tag(name):
+                    players.append({'server': server_name, 'server_id': server_id, 'nick': name})
+                    logger.debug(f"[SQStat] {server_name} → {name}")
+
+        return {'players': players, 'fetched_at': time.time()}
+
+    async def get_snapshot(self) -> dict:
+        """Снапшот онлайна; 20 одновременных вызовов = 1 запрос к sqstat"""
+        return await self._cache.get("clan", self._fetch)
+
+    def peek_snapshot(self) -> Optional[dict]:
+        """Последний снапшот без запроса к sqstat — безопасно читать из потока API"""
+        snapshot, _ = self._cache.peek("clan")
+        return snapshot
+
+    def add_listener(self, callback: Callable[[dict], Awaitable[None]]):
+        """callback(diff) вызывается, когда кто-то зашёл или вышел"""
+        self._listeners.append(callback)
+
+    async def poll(self):
+        """Задача планировщика: обновляет снапшот и рассылает diff подписчикам"""
+        try:
+            snapshot = await self._cache.refresh("clan", self._fetch)
+        except Exception as e:
+            logger.warning(f"⚠️ [SQStat] Опрос clan.php не удался: {e}")
+            return
+
+        previous, self._previous = self._previous, snapshot
+        if previous is None:
+            return  # первый опрос после старта — не считаем всех «зашедшими»
+
+        diff = diff_snapshots(previous, snapshot)
+        if not diff['joined'] and not diff['left']:
+            return
+        logger.info(f"👥 [SQStat] Зашли: {len(diff['joined'])}, вышли: {len(diff['left'])}")
+        for callback in self._listeners:
+            try:
+                await callback(diff)
+            except Exception as e:
+                logger.error(f"❌ Обработчик онлайна: {e}")
+
+    async def get_message(self) -> Optional[str]:
+        """HTML-сообщение для /pet_online; None — никого нет в сети"""
+        snapshot = await self.get_snapshot()
+        if snapshot is not self._rendered:
+            self._rendered_text = render_online(snapshot)
+            self._rendered = snapshot
+        return self._rendered_text
+
+
+def clean_nick(nick: str) -> str:
+    return strip_tag(nick)
+
+
+def diff_snapshots(old: dict, new: dict) -> Dict[str, List[dict]]:
+    """Кто зашёл / вышел между двумя снапшотами (смена сервера — не выход)"""
+    old_players = {clean_nick(p['nick']): p for p in old.get('players', [])}
+    new_players = {clean_nick(p['nick']): p for p in new.get('players', [])}
+    return {
+        'joined': [new_players[n] for n in new_players.keys() - old_players.keys()],
+        'left': [old_players[n] for n in old_players.keys() - new_players.keys()],
+    }
+
+
+def render_online(snapshot: dict) -> Optional[str]:
+    found = snapshot.get('players', [])
+    if not found:
+        return None
+
+    # 🔹 Группируем по серверам
+    servers_grouped = defaultdict(list)
+    for p in found:
+        servers_grouped[p['server']].append(p['nick'])
+
+    lines = ["🟢 <b>Клан [PET] по серверам Protocol:</b>\n"]
+    total = 0
+
+    for server, players_list in servers_grouped.items():
+        count = len(players_list)
+        if count == 0:
+            continue
+        total += count
+        srv_clean = server.replace("Protocol ", "").strip()
+        lines.append(f"🎮 <b>{srv_clean}</b> ({count}): ")
+
+        # Чистим ники от тегов
+        clean_nicks = []
+        for nick in players_list:
+            cleaned = clean_nick(nick)
+            if cleaned and len(cleaned) < 50:
+                clean_nicks.append(cleaned)
+
+        # Группируем по 5 в строку
+        for i in range(0, len(clean_nicks), 5):
+            chunk = clean_nicks[i:i + 5]
+            nick_str = "  •  ".join(f"<code>{html.escape(n)}</code>" for n in chunk if n)
+            if nick_str:
+                lines.append("  •  " + nick_str)
+        lines.append("")
+
+    updated = datetime.fromtimestamp(snapshot['fetched_at'], pytz.timezone("Europe/Moscow"))
+    lines.append(f"📊 <i>Всего онлайн: {total} | Обновлено: {updated.strftime('%H:%M:%S')}</i>")
+    return "\n".join(lines)
+
+
+clan_online = ClanOnlineService()
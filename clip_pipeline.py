@@ -0,0 +1,249 @@
+# clip_pipeline.py
+import os
+import time
+import uuid
+import asyncio
+import logging
+import tempfile
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from aiogram.utils.exceptions import MessageNotModified, TelegramAPIError
+
+from circuit_breaker import CircuitOpenError
+from drive_uploader import ResumableUpload, MAX_CHUNK
+from gdrive import share_drive_file
+from tg_gateway import gateway, PRIORITY_INTERACTIVE, PRIORITY_REPORT
+
+logger = logging.getLogger(__name__)
+
+CLIP_WORKERS = int(os.getenv("CLIP_WORKERS", "2"))            # одновременных загрузок
+CLIP_MAX_ATTEMPTS = int(os.getenv("CLIP_MAX_ATTEMPTS", "4"))  # попыток на шаг
+RETRY_BASE_DELAY = 5        # сек, дальше удваивается
+MAX_RETRY_DELAY = 300
+CIRCUIT_RETRY_FLOOR = 5     # сек, не чаще — когда предохранитель Drive открыт или занят пробой
+TG_DOWNLOAD_CHUNK = 64 * 1024  # кусок скачивания с серверов Telegram
+PROGRESS_STEP = 0.25        # как часто обновлять сообщение о прогрессе
+
+Step = Callable[["ClipJob"], Awaitable[None]]
+
+
+class ClipJob:
+    """Клип в очереди: данные заявки + какие шаги уже выполнены"""
+
+    def __init__(self, user_id: int, username: str, nick: str, description: str,
+                 video_file_id: Optional[str] = None, link: Optional[str] = None):
+        self.clip_id = uuid.uuid4().hex[:8]
+        self.user_id = user_id
+        self.username = username
+        self.nick = nick
+        self.description = description
+        self.video_file_id = video_file_id
+        self.link = link
+        self.created_at = time.time()
+        self.filename = f"clip_{nick or user_id}_{self.clip_id}.mp4"
+
+        self.done: List[str] = []          # выполненные шаги — повтор начинается с упавшего
+        self.attempts = 0                  # неудачных попыток текущего шага
+        self.status_message: Optional[Tuple[int, int]] = None  # (chat_id, message_id)
+        self.reported_progress = 0.0
+
+        self.spool = None                  # временный файл со скачанным видео
+        self.upload: Optional[ResumableUpload] = None  # resumable-сессия — переживает повторы
+        self.drive: Optional[dict] = None  # {'file_id', 'web_view_link', ...}
+        self.notified: Set[int] = set()    # админы, которым сообщение о клипе уже доставлено
+
+    @property
+    def drive_link(self) -> str:
+        return (self.drive or {}).get('web_view_link') or self.link or ""
+
+    def close(self):
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+
+
+class ClipPipeline:
+    """
+    Фоновая обработка клипов: заявка встаёт в очередь, пользователь сразу получает ответ.
+    Пул из CLIP_WORKERS воркеров проходит шаги download → upload → share → (шаги бота:
+    строка в таблице, сообщение модераторам). Упавший шаг повторяется с нарастающей
+    паузой; resumable-загрузка (drive_uploader) при повторе продолжается с принятого Drive байта.
+    """
+
+    def __init__(self, workers: int = CLIP_WORKERS, max_attempts: int = CLIP_MAX_ATTEMPTS):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self._bot = None
+        self._steps: List[Tuple[str, Step]] = [
+            ('download', self._download),
+            ('upload', self._upload),
+            ('share', self._share),
+        ]
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._retry_tasks = set()
+        self._in_progress: Dict[str, ClipJob] = {}
+        self._stats = {'queued': 0, 'done': 0, 'failed': 0, 'retries': 0}
+
+    def set_bot(self, bot):
+        """Bot нужен для скачивания файлов из Telegram"""
+        self._bot = bot
+
+    def add_step(self, name: str, step: Step):
+        """Шаг после загрузки на Drive (выполняется ровно один раз при успехе)"""
+        self._steps.append((name, step))
+
+    # =========================
+    # 🚦 ЗАПУСК / ОСТАНОВКА
+    # =========================
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"🎬 Конвейер клипов запущен ({self.workers} воркера)")
+
+    async def stop(self):
+        for task in [*self._tasks, *self._retry_tasks]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._retry_tasks, return_exceptions=True)
+        self._tasks = []
+        for job in self._in_progress.values():
+            job.close()
+        if self._in_progress:
+            logger.warning(f"⚠️ Конвейер клипов остановлен, не обработано: {len(self._in_progress)}")
+        self._in_progress.clear()
+
+    async def submit(self, job: ClipJob):
+        self._in_progress[job.clip_id] = job
+        self._stats['queued'] += 1
+        await self._queue.put(job)
+
+    def stats(self) -> dict:
+        return {**self._stats, 'in_progress': len(self._in_progress),
+                'queue': self._queue.qsize() if self._queue else 0}
+
+    # =========================
+    # 👷 ВОРКЕРЫ
+    # =========================
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ [Клип {job.clip_id}] Воркер {index}: {type(e).__name__}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job: ClipJob):
+        for name, step in self._steps:
+            if name in job.done:
+                continue
+            try:
+                await step(job)
+            except Exception as e:
+                self._on_step_failed(job, name, e)
+                return
+            job.done.append(name)
+            job.attempts = 0
+
+        job.close()
+        self._in_progress.pop(job.clip_id, None)
+        self._stats['done'] += 1
+        logger.info(f"✅ [Клип {job.clip_id}] Готов за {time.time() - job.created_at:.0f} с")
+        if job.video_file_id is not None:
+            # Клип ссылкой пользователь уже получил «отправлен на модерацию» — второе сообщение лишнее
+            await self._set_status(job, f"✅ Клип #{job.clip_id} загружен и отправлен на модерацию!")
+
+    def _on_step_failed(self, job: ClipJob, step: str, error: Exception):
+        if isinstance(error, CircuitOpenError):
+            # Запрос не отправлялся — это не попытка шага: ждём, пока предохранитель пропустит
+            delay = max(CIRCUIT_RETRY_FLOOR, error.retry_in)
+            logger.info(f"⏸ [Клип {job.clip_id}] Шаг {step} отложен на {delay:.0f} с: {error}")
+            self._stats['retries'] += 1
+            task = asyncio.create_task(self._retry_later(job, delay))
+            self._retry_tasks.add(task)
+            task.add_done_callback(self._retry_tasks.discard)
+            return
+
+        job.attempts += 1
+        logger.warning(f"⚠️ [Клип {job.clip_id}] Шаг {step}, попытка {job.attempts}: {type(error).__name__}: {error}")
+
+        if job.attempts >= self.max_attempts:
+            job.close()
+            self._in_progress.pop(job.clip_id, None)
+            self._stats['failed'] += 1
+            logger.error(f"❌ [Клип {job.clip_id}] Не удалось обработать (шаг {step})")
+            task = asyncio.create_task(self._set_status(
+                job, f"❌ Не удалось загрузить клип #{job.clip_id}. Попробуйте отправить его ещё раз"))
+        else:
+            delay = min(MAX_RETRY_DELAY, RETRY_BASE_DELAY * 2 ** (job.attempts - 1))
+            self._stats['retries'] += 1
+            task = asyncio.create_task(self._retry_later(job, delay))
+        self._retry_tasks.add(task)
+        task.add_done_callback(self._retry_tasks.discard)
+
+    async def _retry_later(self, job: ClipJob, delay: float):
+        await asyncio.sleep(delay)
+        await self._queue.put(job)
+
+    # =========================
+    # ☁️ ШАГИ
+    # =========================
+    async def _download(self, job: ClipJob):
+        """Telegram → временный файл: в памяти не больше MAX_CHUNK, остальное на диске"""
+        if job.video_file_id is None:
+            return  # клип ссылкой — качать нечего
+        job.close()
+        tg_file = await self._bot.get_file(job.video_file_id)
+        job.spool = tempfile.SpooledTemporaryFile(max_size=MAX_CHUNK)
+        await self._bot.download_file(tg_file.file_path, destination=job.spool, chunk_size=TG_DOWNLOAD_CHUNK)
+
+    async def _upload(self, job: ClipJob):
+        if job.video_file_id is None:
+            return
+        if job.upload is None:
+            folder_id = os.getenv('GDRIVE_FOLDER_ID')
+            job.upload = ResumableUpload(job.spool, job.filename, job.description,
+                                         parents=[folder_id] if folder_id else None)
+        # Асинхронно в loop бота; при повторе — продолжение той же сессии загрузки
+        await job.upload.run(lambda fraction: self._report_progress(job, fraction))
+        job.close()  # файл на Drive — временный больше не нужен
+
+    async def _share(self, job: ClipJob):
+        if job.video_file_id is None:
+            job.drive = {'file_id': '', 'web_view_link': job.link}
+            return
+        job.drive = await asyncio.to_thread(share_drive_file, job.upload.result)
+
+    # =========================
+    # 💬 СТАТУС ДЛЯ ПОЛЬЗОВАТЕЛЯ
+    # =========================
+    def _report_progress(self, job: ClipJob, fraction: float):
+        if fraction - job.reported_progress < PROGRESS_STEP:
+            return
+        job.reported_progress = fraction
+        task = asyncio.create_task(self._set_status(
+            job, f"⏳ Клип #{job.clip_id}: загружено {fraction:.0%}", priority=PRIORITY_REPORT))
+        self._retry_tasks.add(task)
+        task.add_done_callback(self._retry_tasks.discard)
+
+    async def _set_status(self, job: ClipJob, text: str, priority: int = PRIORITY_INTERACTIVE):
+        """Правит сообщение о статусе; если его нет — присылает новое"""
+        try:
+            if job.status_message:
+                chat_id, message_id = job.status_message
+                await gateway.call("edit_message_text", text, chat_id=chat_id,
+                                   message_id=message_id, priority=priority)
+            else:
+                await gateway.send_message(job.user_id, text, priority=priority)
+        except MessageNotModified:
+            pass
+        except (TelegramAPIError, RuntimeError) as e:
+            logger.warning(f"⚠️ [Клип {job.clip_id}] Статус не доставлен: {e}")
+
+
+clip_pipeline = ClipPipeline()
@@ -0,0 +1,230 @@
+# drive_uploader.py
+import io
+import os
+import re
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+import aiohttp
+
+import http_client
+from circuit_breaker import breakers
+
+logger = logging.getLogger(__name__)
+
+# Базовый адрес можно подменить локальным стендом (benchmarks/drive_standin.py)
+DRIVE_UPLOAD_BASE_URL = os.getenv("DRIVE_UPLOAD_BASE_URL", "https://www.googleapis.com")
+UPLOAD_FIELDS = "id, webViewLink, webContentLink, name"
+
+CHUNK_ALIGN = 256 * 1024                                       # Drive требует кратность 256 КБ
+MIN_CHUNK = CHUNK_ALIGN
+# Предел куска — он же предел памяти на загрузку; не кратный 256 КБ Drive отвергнет — округляем вниз
+MAX_CHUNK = max(MIN_CHUNK, int(os.getenv("DRIVE_MAX_CHUNK", str(8 * 1024 * 1024))) // CHUNK_ALIGN * CHUNK_ALIGN)
+INITIAL_CHUNK = min(MAX_CHUNK, 1024 * 1024)
+TARGET_CHUNK_SECONDS = 3.0    # под это время отправки подстраивается размер куска
+CHUNK_TIMEOUT = 120           # сек на один кусок (общая сессия по умолчанию — 15 с)
+CHUNK_RETRIES = 3             # повторов куска подряд, дальше — ошибка наверх
+
+RANGE_RE = re.compile(r"bytes=0-(\d+)")
+
+
+class DriveUploadError(Exception):
+    """Drive ответил ошибкой на шаг загрузки"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"HTTP {status}: {message[:200]}")
+        self.status = status
+
+    @property
+    def retryable(self) -> bool:
+        return self.status >= 500 or self.status == 429
+
+
+async def _default_token() -> str:
+    # gdrive тянет googleapiclient — импорт здесь, чтобы загрузчик работал со стендом и без него
+    from gdrive import get_access_token
+    return await asyncio.to_thread(get_access_token)
+
+
+class ResumableUpload:
+    """
+    Resumable-загрузка в Drive напрямую по HTTP через общую aiohttp-сессию — без потоков.
+    - размер куска подстраивается под скорость: быстрее TARGET_CHUNK_SECONDS — растёт
+      (до MAX_CHUNK), медленнее или с ошибкой — уменьшается (до MIN_CHUNK);
+    - после сбоя позиция берётся у сервера (PUT с Content-Range: bytes */размер),
+      повторный run() продолжает ту же сессию загрузки;
+    - параллельные загрузки — просто несколько объектов.
+    """
+
+    def __init__(self, stream, filename: str, description: str = "", mimetype: str = "video/mp4",
+                 parents: Optional[List[str]] = None, base_url: str = DRIVE_UPLOAD_BASE_URL,
+                 token_provider: Optional[Callable[[], Awaitable[str]]] = None,
+                 session: Optional[aiohttp.ClientSession] = None, fields: str = UPLOAD_FIELDS):
+        self.stream = stream
+        self.filename = filename
+        self.description = description
+        self.mimetype = mimetype
+        self.parents = parents
+        self.base_url = base_url.rstrip("/")
+        self.fields = fields
+        self._token_provider = token_provider or _default_token
+        self._session = session
+
+        stream.seek(0, io.SEEK_END)
+        self.size = stream.tell()
+        stream.seek(0)
+
+        self.session_uri: Optional[str] = None
+        self.offset = 0
+        self.chunk_size = INITIAL_CHUNK
+        self.result: Optional[dict] = None
+        self._needs_sync = False     # после сбоя сначала узнаём у сервера позицию
+        self.stats = {'chunks': 0, 'retries': 0, 'resumes': 0, 'restarts': 0}
+
+    @property
+    def progress(self) -> float:
+        return self.offset / self.size if self.size else 1.0
+
+    def _http(self) -> aiohttp.ClientSession:
+        return self._session or http_client.get_session()
+
+    async def _auth(self, **headers) -> dict:
+        return {'Authorization': f"Bearer {await self._token_provider()}", **headers}
+
+    @staticmethod
+    async def _error(response: aiohttp.ClientResponse) -> DriveUploadError:
+        return DriveUploadError(response.status, await response.text())
+
+    # =========================
+    # 📡 ПРОТОКОЛ
+    # =========================
+    async def _start(self):
+        """Открывает сессию загрузки — в ответе Location с её адресом"""
+        metadata = {'name': self.filename, 'description': self.description[:100]}
+        if self.parents:
+            metadata['parents'] = self.parents
+        headers = await self._auth(**{
+            'X-Upload-Content-Type': self.mimetype,
+            'X-Upload-Content-Length': str(self.size),
+        })
+        async with self._http().post(
+            f"{self.base_url}/upload/drive/v3/files",
+            params={'uploadType': 'resumable', 'fields': self.fields},
+            json=metadata, headers=headers,
+            timeout=aiohttp.ClientTimeout(total=CHUNK_TIMEOUT),
+        ) as response:
+            if response.status != 200:
+                raise await self._error(response)
+            self.session_uri = response.headers['Location']
+        self.offset = 0
+        self._needs_sync = False
+
+    def _accept(self, response: aiohttp.ClientResponse):
+        """308: сервер сообщает, сколько байт принято (Range), — отсюда и продолжаем"""
+        match = RANGE_RE.match(response.headers.get('Range', ''))
+        self.offset = int(match.group(1)) + 1 if match else 0
+
+    async def _finish(self, response: aiohttp.ClientResponse):
+        self.result = await response.json(content_type=None)
+        self.offset = self.size
+
+    async def _sync_offset(self):
+        """Спрашивает у Drive позицию сессии; истёкшая сессия — загрузка начнётся заново"""
+        headers = await self._auth(**{'Content-Range': f"bytes */{self.size}", 'Content-Length': '0'})
+        async with self._http().put(self.session_uri, headers=headers,
+                                    timeout=aiohttp.ClientTimeout(total=CHUNK_TIMEOUT)) as response:
+            if response.status == 308:
+                self._accept(response)
+            elif response.status in (200, 201):
+                await self._finish(response)
+            elif response.status in (404, 410):
+                logger.warning(f"⚠️ [Drive] Сессия загрузки {self.filename} истекла — начинаю заново")
+                self.session_uri = None
+                self.stats['restarts'] += 1
+            else:
+                raise await self._error(response)
+        self._needs_sync = False
+
+    def _read(self, offset: int, size: int) -> bytes:
+        self.stream.seek(offset)
+        return self.stream.read(size)
+
+    async def _send_chunk(self):
+        data = await asyncio.to_thread(self._read, self.offset, self.chunk_size)
+        if data:
+            content_range = f"bytes {self.offset}-{self.offset + len(data) - 1}/{self.size}"
+        else:
+            content_range = f"bytes */{self.size}"  # пустой файл
+        headers = await self._auth(**{'Content-Range': content_range, 'Content-Type': self.mimetype})
+
+        started = time.monotonic()
+        async with self._http().put(self.session_uri, data=data, headers=headers,
+                                    timeout=aiohttp.ClientTimeout(total=CHUNK_TIMEOUT)) as response:
+            if response.status == 308:
+                self._accept(response)
+            elif response.status in (200, 201):
+                await self._finish(response)
+            elif response.status in (404, 410):
+                self.session_uri = None
+                raise DriveUploadError(response.status, "сессия загрузки истекла")
+            else:
+                raise await self._error(response)
+        self.stats['chunks'] += 1
+        self._adapt(time.monotonic() - started)
+
+    def _adapt(self, elapsed: float):
+        if elapsed < TARGET_CHUNK_SECONDS / 2 and self.chunk_size < MAX_CHUNK:
+            self.chunk_size = min(MAX_CHUNK, self.chunk_size * 2)
+        elif elapsed > TARGET_CHUNK_SECONDS * 2:
+            self._shrink()
+
+    def _shrink(self):
+        self.chunk_size = max(MIN_CHUNK, self.chunk_size // 2 // CHUNK_ALIGN * CHUNK_ALIGN)
+
+    # =========================
+    # 🚀 ЗАГРУЗКА
+    # =========================
+    async def run(self, on_progress: Optional[Callable[[float], None]] = None) -> dict:
+        """
+        Загрузка до конца; on_progress(0..1) — после каждого куска. Повторный вызов продолжает.
+        Через предохранитель google_drive идёт каждый запрос (сессия, позиция, кусок), а не вся
+        загрузка: пробный запрос после паузы короткий, а при открытом предохранителе
+        CircuitOpenError вылетает наверх без попыток — позиция сессии при этом не теряется.
+        """
+        if self.result is not None:
+            return self.result
+        if self.session_uri and self._needs_sync:
+            self.stats['resumes'] += 1
+            logger.info(f"🔁 [Drive] Продолжаю {self.filename} с позиции, которую сообщит Drive")
+
+        drive = breakers['google_drive']
+        failures = 0
+        while self.result is None:
+            try:
+                # Позиция после сбоя, новая сессия и сам кусок — всё под одним счётчиком повторов
+                if self.session_uri and self._needs_sync:
+                    await drive.call(self._sync_offset)
+                if self.session_uri is None:
+                    await drive.call(self._start)
+                if self.result is None:
+                    await drive.call(self._send_chunk)
+                failures = 0
+            except (aiohttp.ClientError, asyncio.TimeoutError, DriveUploadError) as e:
+                if isinstance(e, DriveUploadError) and not e.retryable and self.session_uri:
+                    raise
+                failures += 1
+                self.stats['retries'] += 1
+                self._needs_sync = self.session_uri is not None
+                if failures > CHUNK_RETRIES:
+                    raise
+                self._shrink()
+                logger.warning(f"⚠️ [Drive] {self.filename}: {type(e).__name__}: {e} — повтор {failures}")
+                await asyncio.sleep(min(30, 2 ** failures))
+                continue
+            if on_progress:
+                on_progress(self.progress)
+
+        logger.info(f"✅ [Drive] {self.filename} загружен: {self.size} байт, {self.stats['chunks']} кусков")
+        return self.result
@@ -1,104 +1,118 @@
 # gdrive.py
 import os
-import io
+import json
 import base64
 import logging
+import threading
+from datetime import datetime, timedelta
+import httplib2
+import google_auth_httplib2
+from google.auth.transport.requests import Request
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload, MediaFileUpload
+from circuit_breaker import breakers
 
 # Настройки
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
 SERVICE_ACCOUNT_FILE = 'credentials.json'
+TOKEN_REFRESH_MARGIN = timedelta(minutes=10)  # обновляем токен заранее, а не на первой загрузке
+# Папка GDRIVE_FOLDER_ID уже открыта «всем, у кого есть ссылка» — файлы наследуют доступ,
+# отдельный permissions().create на каждый клип не нужен
+INHERIT_SHARING = os.getenv('GDRIVE_INHERIT_SHARING', '0') == '1'
 
+# Один сервис и одни учётные данные на процесс; httplib2 не потокобезопасен —
+# у каждого потока свой AuthorizedHttp поверх общих credentials
+_lock = threading.Lock()
+_credentials = None
+_service = None
+_thread_local = threading.local()
 
-def get_drive_service():
-    """Инициализация сервиса Google Drive"""
-    try:
-        creds_b64 = os.getenv('GDRIVE_CREDENTIALS_B64')
-
-        if creds_b64:
-            creds_data = base64.b64decode(creds_b64)
-            with open('credentials.json', 'wb') as f:
-                f.write(creds_data)
-
-        if not os.path.exists(SERVICE_ACCOUNT_FILE):
-            logging.error("❌ credentials.json не найден!")
-            raise FileNotFoundError("credentials.json not found")
 
-        credentials = service_account.Credentials.from_service_account_file(
-            SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+def _load_credentials():
+    """Ключ сервисного аккаунта из GDRIVE_CREDENTIALS_B64 (в памяти) или credentials.json"""
+    creds_b64 = os.getenv('GDRIVE_CREDENTIALS_B64')
+    if creds_b64:
+        info = json.loads(base64.b64decode(creds_b64))
+        return service_account.Credentials.from_service_account_info(info, scopes=SCOPES)
 
-        return build('drive', 'v3', credentials=credentials)
-    except Exception as e:
-        logging.error(f"❌ Ошибка инициализации Drive сервиса: {e}")
-        raise
+    if not os.path.exists(SERVICE_ACCOUNT_FILE):
+        logging.error("❌ credentials.json не найден!")
+        raise FileNotFoundError("credentials.json not found")
+    return service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
 
 
-def upload_video_to_drive(file_bytes: bytes, filename: str, description: str = "") -> dict:
+def get_drive_service():
+    """Сервис Google Drive — создаётся один раз на процесс"""
+    global _credentials, _service
+    if _service is not None:
+        return _service
+    with _lock:
+        if _service is None:
+            try:
+                _credentials = _load_credentials()
+                _service = build('drive', 'v3', credentials=_credentials, cache_discovery=False)
+                logging.info("☁️ Drive сервис инициализирован")
+            except Exception as e:
+                logging.error(f"❌ Ошибка инициализации Drive сервиса: {e}")
+                raise
+    return _service
+
+
+def _http():
+    """AuthorizedHttp текущего потока для request.execute(http=...)"""
+    http = getattr(_thread_local, 'http', None)
+    if http is None:
+        get_drive_service()
+        http = google_auth_httplib2.AuthorizedHttp(_credentials, http=httplib2.Http())
+        _thread_local.http = http
+    return http
+
+
+def refresh_credentials():
+    """Задача планировщика: обновляет токен до истечения — загрузка не ждёт OAuth"""
+    get_drive_service()
+    with _lock:
+        expiry = _credentials.expiry
+        if _credentials.valid and expiry and expiry - datetime.utcnow() > TOKEN_REFRESH_MARGIN:
+            return
+        _credentials.refresh(Request())
+    logging.info(f"☁️ Drive токен обновлён до {_credentials.expiry:%H:%M} UTC")
+
+
+def get_access_token() -> str:
+    """Действующий OAuth-токен для прямых HTTP-запросов к Drive (drive_uploader)"""
+    refresh_credentials()
+    return _credentials.token
+
+
+def share_drive_file(file: dict) -> dict:
     """
-    Загружает видео на Google Drive
-    Важно: file_bytes должен быть типом bytes, а не BytesIO
+    Открывает загруженный файл по ссылке и возвращает ссылки на него.
+    file — ответ загрузки (drive_uploader): ссылки уже запрошены в fields, повторный get не нужен.
     """
-    try:
-        service = get_drive_service()
-        folder_id = os.getenv('GDRIVE_FOLDER_ID')
-
-        # 🔥 Проверка типа данных
-        if not isinstance(file_bytes, bytes):
-            logging.error(f"❌ Ожидается bytes, получено: {type(file_bytes)}")
-            raise TypeError("file_bytes должен быть bytes")
-
-        logging.info(f"📦 Размер файла для загрузки: {len(file_bytes)} байт")
-
-        # Метаданные
-        file_metadata = {
-            'name': filename,
-            'description': description[:100],
-        }
-        if folder_id:
-            file_metadata['parents'] = [folder_id]
-
-        # 🔥 Создаём BytesIO объект ПРАВИЛЬНО
-        file_stream = io.BytesIO(file_bytes)
-
-        # 🔥 MediaIoBaseUpload с правильными параметрами
-        media = MediaIoBaseUpload(
-            file_stream,
-            mimetype='video/mp4',
-            resumable=True,
-            chunksize=256 * 1024  # 256KB chunks (стабильнее для Railway)
-        )
-
-        # Создание файла
-        file = service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields='id, webViewLink, webContentLink, name'
-        ).execute()
+    if not INHERIT_SHARING:
+        # Drive недоступен — CircuitOpenError сразу, без ожидания таймаутов
+        breakers['google_drive'].call_sync(_share_drive_file, file['id'])
 
-        # Делаем файл публичным по ссылке
-        service.permissions().create(
-            fileId=file['id'],
-            body={'type': 'anyone', 'role': 'reader'},
-            fields='id'
-        ).execute()
+    logging.info(f"✅ Видео загружено: {file.get('webViewLink')}")
 
-        # Получаем финальную ссылку
-        file = service.files().get(
-            fileId=file['id'],
-            fields='id, webViewLink, webContentLink, name'
-        ).execute()
+    return {
+        'file_id': file['id'],
+        'web_view_link': file.get('webViewLink'),
+        'web_content_link': file.get('webContentLink'),
+        'name': file.get('name')
+    }
 
-        logging.info(f"✅ Видео загружено: {file.get('webViewLink')}")
 
-        return {
-            'file_id': file['id'],
-            'web_view_link': file.get('webViewLink'),
-            'web_content_link': file.get('webContentLink'),
-            'name': file.get('name')
-        }
+def _share_drive_file(file_id: str):
+    try:
+        # Делаем файл публичным по ссылке
+        get_drive_service().permissions().create(
+            fileId=file_id,
+            body={'type': 'anyone', 'role': 'reader'},
+            fields='id'
+        ).execute(http=_http())
 
     except Exception as e:
         logging.error(f"❌ Ошибка Google Drive: {type(e).__name__}: {e}")
-        raise
\ No newline at end of file
+        raise
@@ -0,0 +1,117 @@
+# http_client.py
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Таймауты и лимиты пула соединений
+TOTAL_TIMEOUT = 15
+CONNECT_TIMEOUT = 5
+POOL_LIMIT = 50
+POOL_LIMIT_PER_HOST = 8
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 60
+
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+CONDITIONAL_CACHE_SIZE = 512  # URL с сохранёнными ETag/Last-Modified
+
+# Одна сессия на event loop: бот и API живут в разных loop'ах
+_sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+
+# URL → {'etag', 'last_modified', 'result'}: валидаторы и уже разобранный ответ
+_conditional: "OrderedDict[str, dict]" = OrderedDict()
+_conditional_stats = {'hits': 0, 'misses': 0, 'no_validators': 0}
+
+
+def _create_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=POOL_LIMIT,
+        limit_per_host=POOL_LIMIT_PER_HOST,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+    )
+    timeout = aiohttp.ClientTimeout(total=TOTAL_TIMEOUT, connect=CONNECT_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, headers=DEFAULT_HEADERS)
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Общая aiohttp-сессия текущего event loop (создаётся лениво)"""
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = _create_session()
+        _sessions[loop] = session
+        logger.info("🌐 Создана общая HTTP-сессия")
+    return session
+
+
+async def start():
+    """Вызывается из on_startup — сессия готова до первого запроса"""
+    get_session()
+
+
+async def close():
+    """Вызывается из on_shutdown — закрывает сессию текущего loop"""
+    loop = asyncio.get_running_loop()
+    session = _sessions.pop(loop, None)
+    if session and not session.closed:
+        await session.close()
+        logger.info("🌐 HTTP-сессия закрыта")
+
+
+# =========================
+# 🔁 УСЛОВНЫЕ ЗАПРОСЫ
+# =========================
+async def get_conditional(url: str, parse: Callable[[str], Any], **kwargs) -> Optional[Any]:
+    """
+    GET с If-None-Match / If-Modified-Since.
+    На 304 возвращает ранее разобранный результат — без загрузки тела и парсинга.
+    None, если ответ не 200/304; на 5xx — исключение.
+    """
+    entry = _conditional.get(url)
+    headers = dict(kwargs.pop('headers', None) or {})
+    if entry:
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    async with get_session().get(url, headers=headers, **kwargs) as response:
+        if response.status == 304 and entry:
+            _conditional_stats['hits'] += 1
+            _conditional.move_to_end(url)
+            return entry['result']
+        if response.status >= 500:
+            response.raise_for_status()  # сбой upstream — пусть увидит предохранитель
+        if response.status != 200:
+            return None
+        text = await response.text()
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+
+    result = parse(text)
+    _conditional_stats['misses'] += 1
+    if etag or last_modified:
+        _conditional[url] = {'etag': etag, 'last_modified': last_modified, 'result': result}
+        _conditional.move_to_end(url)
+        while len(_conditional) > CONDITIONAL_CACHE_SIZE:
+            _conditional.popitem(last=False)
+    else:
+        _conditional_stats['no_validators'] += 1
+        _conditional.pop(url, None)
+    return result
+
+
+def conditional_stats() -> dict:
+    """Счётчики для /http_stats: hits — 304, misses — полная загрузка"""
+    total = _conditional_stats['hits'] + _conditional_stats['misses']
+    return {
+        **_conditional_stats,
+        'hit_rate': _conditional_stats['hits'] / total if total else 0.0,
+        'entries': len(_conditional),
+    }
@@ -1,9 +1,17 @@
 # krestgg_parser.py
+import os
 import re
 import time
+import asyncio
 import logging
-from typing import Dict, List
-from playwright.async_api import async_playwright
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import pytz
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+
+from circuit_breaker import breakers, CircuitOpenError
+from nick_tags import PET_TAG
 
 logger = logging.getLogger(__name__)
 
@@ -16,107 +24,441 @@ SERVERS_TO_CHECK = [
     {"id": "TRN", "text_pattern": r"\[RU\]\[TRN"},
 ]
 
+# Тёплый браузер: перезапуск после N сканов или при превышении памяти
+MAX_SCANS_PER_BROWSER = int(os.getenv("KRESTGG_MAX_SCANS_PER_BROWSER", "50"))
+MAX_BROWSER_RSS_MB = int(os.getenv("KRESTGG_MAX_BROWSER_RSS_MB", "600"))
+
+# 🔧 ПОДДЕРЖКА ВСЕХ ФОРМАТОВ: [PET], |PET|, | PET | (с пробелами) — грамматика из nick_tags
+NICK_RE = re.compile(PET_TAG + r"\s*(.+?)(?:В\s*друзья|$)", re.IGNORECASE | re.DOTALL)
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+# Один вызов в странице: тексты самых глубоких элементов с тегом клана
+EXTRACT_TAGGED_JS = """
+(pattern) => {
+    const tag = new RegExp(pattern, 'i');
+    const texts = [];
+    for (const el of document.body.querySelectorAll('*')) {
+        const text = el.textContent;
+        if (!text || !tag.test(text)) continue;
+        let deeper = false;
+        for (const child of el.children) {
+            if (tag.test(child.textContent)) { deeper = true; break; }
+        }
+        if (!deeper) texts.push(text);
+    }
+    return texts;
+}
+"""
+
+# Ожидание смены списка после клика: подпись текста страницы отличается от исходной
+# и не меняется SETTLE_POLLS опросов подряд (список дорисовался). Если за UNCHANGED_GRACE_MS
+# страница так и не изменилась — список тот же (сервер уже был выбран), ждать дальше незачем
+SWITCH_SETTLED_JS = """
+([before, settlePolls, graceMs]) => {
+    const text = document.body.textContent;
+    let hash = 0;
+    for (let i = 0; i < text.length; i++) hash = (hash * 31 + text.charCodeAt(i)) | 0;
+    const sig = text.length + ':' + hash;
+    const state = window.__petSwitch || (window.__petSwitch = {last: null, same: 0, started: Date.now()});
+    if (sig === before) return Date.now() - state.started >= graceMs;
+    if (sig === state.last) { state.same++; } else { state.last = sig; state.same = 0; }
+    return state.same >= settlePolls;
+}
+"""
+PAGE_SIGNATURE_JS = """
+() => {
+    window.__petSwitch = null;
+    const text = document.body.textContent;
+    let hash = 0;
+    for (let i = 0; i < text.length; i++) hash = (hash * 31 + text.charCodeAt(i)) | 0;
+    return text.length + ':' + hash;
+}
+"""
+# Кнопка сервера уже выбрана: класс active/selected/current или aria-* у неё или родителя
+SERVER_ACTIVE_JS = """
+(el) => {
+    for (let node = el, depth = 0; node && depth < 2; node = node.parentElement, depth++) {
+        if (/\\b(active|selected|current)\\b/i.test(node.getAttribute('class') || '')) return true;
+        for (const attr of ['aria-selected', 'aria-pressed', 'aria-current']) {
+            const value = node.getAttribute(attr);
+            if (value && value !== 'false') return true;
+        }
+    }
+    return false;
+}
+"""
+# Список игроков дорисован: строк с кнопкой «В друзья» не меньше ожидаемого (0 — сервер пуст).
+# Без этого подпись до клика или разбор могли поймать ещё грузящийся список
+PLAYERS_READY_JS = """
+([marker, expected]) => {
+    const rows = document.body.textContent.split(marker).length - 1;
+    return rows >= expected;
+}
+"""
+PLAYER_ROW_MARKER = "В друзья"
+SERVER_ONLINE_RE = re.compile(r"(\d+)\s*/\s*\d+")
+
+READY_TIMEOUT = 10000    # потолок ожидания кнопки сервера и списка игроков, мс
+SWITCH_TIMEOUT = 5000    # потолок ожидания смены списка после клика, мс
+UNCHANGED_GRACE_MS = 1500  # столько ждём первых изменений (как прежняя фиксированная пауза)
+POLL_INTERVAL_MS = 100
+SETTLE_POLLS = 2
+
+# Картинки, шрифты, медиа и аналитика для списка игроков не нужны
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+BLOCKED_HOSTS = ("google-analytics.com", "googletagmanager.com", "mc.yandex.ru", "yandex.ru/metrika",
+                 "doubleclick.net", "facebook.net", "vk.com/rtrg", "top-fwz1.mail.ru")
+
+# Свежесть данных сервера зависит от времени суток (МСК): (с часа, до часа, TTL сек)
+TTL_SCHEDULE = [
+    (18, 24, 60),    # прайм-тайм — онлайн меняется быстро
+    (10, 18, 180),
+    (0, 10, 600),    # ночь — сканировать часто незачем
+]
+REFRESH_INTERVAL = 60  # период задачи планировщика, сек
+
+# Сколько серверов сканируем одновременно (1 — последовательно)
+SCAN_CONCURRENCY = int(os.getenv("KRESTGG_SCAN_CONCURRENCY", "3"))
+
+# Без --single-process: с ним Chromium нестабилен при нескольких вкладках
 BROWSER_ARGS = [
     "--no-sandbox", "--disable-setuid-sandbox", "--disable-dev-shm-usage",
-    "--disable-gpu", "--single-process", "--disable-extensions", "--no-zygote"
+    "--disable-gpu", "--disable-extensions", "--no-zygote"
 ]
 
 
+def process_tree_rss_mb(root_pid: Optional[int] = None, include_root: bool = False) -> Optional[float]:
+    """RSS потомков процесса (по умолчанию текущего: драйвер playwright + Chromium) по /proc, МБ"""
+    root_pid = root_pid or os.getpid()
+    try:
+        parents = {}
+        for pid in os.listdir('/proc'):
+            if not pid.isdigit():
+                continue
+            try:
+                with open(f'/proc/{pid}/stat') as f:
+                    # comm может содержать пробелы — ppid идёт после ')'
+                    parents[int(pid)] = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+
+        descendants, frontier = set(), {root_pid}
+        while frontier:
+            frontier = {pid for pid, ppid in parents.items() if ppid in frontier} - descendants
+            descendants |= frontier
+        if include_root:
+            descendants.add(root_pid)
+
+        total_kb = 0
+        for pid in descendants:
+            try:
+                with open(f'/proc/{pid}/status') as f:
+                    for line in f:
+                        if line.startswith('VmRSS:'):
+                            total_kb += int(line.split()[1])
+                            break
+            except (OSError, ValueError):
+                continue
+        return total_kb / 1024
+    except OSError:
+        return None  # не Linux
+
+
 class KrestGGParser:
     def __init__(self, timeout: int = 15000):
         self.timeout = timeout
-        self._cache = {"data": {}, "timestamp": 0, "ttl": 120}
+        # srv id → {'name', 'players', 'updated_at'}; у каждого сервера своя свежесть
+        self._servers: Dict[str, dict] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._force_pending = False  # force пришёл во время скана — нужен ещё один полный
+        self._worker = None  # KrestGGWorkerClient: скан в отдельном процессе
 
-    async def get_pet_online_by_server(self, force_refresh: bool = False) -> Dict[str, List[str]]:
-        now = time.time()
-        if not force_refresh and self._cache["data"] and (now - self._cache["timestamp"]) < self._cache["ttl"]:
-            return self._cache["data"]
+        # 🔥 Долгоживущие playwright / браузер / контекст
+        self._playwright = None
+        self._browser = None
+        self._context = None
+        self._scans_on_browser = 0
+        self._needs_recycle = False
+        self._browser_lock: Optional[asyncio.Lock] = None
+        self._active_scans = 0  # сканов, которые сейчас держат контекст — при них браузер не закрываем
 
-        logger.info("🔍 Сканирую сервера...")
-        result = {}
+    # =========================
+    # 🔥 ТЁПЛЫЙ БРАУЗЕР
+    # =========================
+    def _recycle_reason(self) -> Optional[str]:
+        if self._browser is None:
+            return None
+        if self._needs_recycle:
+            return "ошибка в прошлом скане"
+        if not self._browser.is_connected():
+            return "браузер отключился"
+        if self._scans_on_browser >= MAX_SCANS_PER_BROWSER:
+            return f"{self._scans_on_browser} сканов"
+        rss = process_tree_rss_mb()
+        if rss is not None and rss > MAX_BROWSER_RSS_MB:
+            return f"RSS {rss:.0f} МБ"
+        return None
 
-        async with async_playwright() as p:
-            try:
-                browser = await p.chromium.launch(headless=True, args=BROWSER_ARGS)
-                context = await browser.new_context(
+    @asynccontextmanager
+    async def _browser_context(self):
+        """
+        Контекст тёплого браузера на время скана; запускает/перезапускает Chromium при необходимости.
+        Перезапуск — только когда браузер никто не держит (иначе отложен до следующего скана).
+        """
+        if self._browser_lock is None:
+            self._browser_lock = asyncio.Lock()
+        async with self._browser_lock:
+            reason = self._recycle_reason()
+            if reason and self._active_scans and self._browser.is_connected():
+                logger.debug(f"♻️ Перезапуск Chromium отложен ({reason}): идёт скан")
+            elif reason:
+                logger.info(f"♻️ Перезапуск Chromium: {reason}")
+                await self._close_browser()
+
+            if self._browser is None:
+                started = time.monotonic()
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(headless=True, args=BROWSER_ARGS)
+                self._context = await self._browser.new_context(
                     user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
                     viewport={"width": 1440, "height": 900}
                 )
-                page = await context.new_page()
+                await self._context.route("**/*", self._route_request)
+                self._scans_on_browser = 0
+                self._needs_recycle = False
+                logger.info(f"🚀 Chromium запущен за {time.monotonic() - started:.1f} с")
+
+            self._scans_on_browser += 1
+            self._active_scans += 1
+            context = self._context
+        try:
+            yield context
+        finally:
+            self._active_scans -= 1
+
+    @staticmethod
+    async def _route_request(route):
+        request = route.request
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or any(h in request.url for h in BLOCKED_HOSTS):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def _close_browser(self):
+        for closable in (self._context, self._browser):
+            try:
+                if closable:
+                    await closable.close()
+            except Exception:
+                pass
+        self._context = None
+        self._browser = None
+
+    def use_worker(self, worker):
+        """Сканировать в отдельном процессе; результаты попадают в кэш этого процесса"""
+        self._worker = worker
+
+    async def close(self):
+        """Вызывается из on_shutdown"""
+        if self._worker is not None:
+            await self._worker.stop()
+        await self._close_browser()
+        if self._playwright:
+            try:
+                await self._playwright.stop()
+            except Exception:
+                pass
+            self._playwright = None
+
+    # =========================
+    # 🗂 КЭШ ПО СЕРВЕРАМ
+    # =========================
+    @staticmethod
+    def current_ttl() -> int:
+        hour = datetime.now(pytz.timezone("Europe/Moscow")).hour
+        for start, end, ttl in TTL_SCHEDULE:
+            if start <= hour < end:
+                return ttl
+        return TTL_SCHEDULE[-1][2]
+
+    def _stale_servers(self, force: bool = False) -> List[dict]:
+        if force:
+            return list(SERVERS_TO_CHECK)
+        ttl = self.current_ttl()
+        now = time.time()
+        return [srv for srv in SERVERS_TO_CHECK
+                if now - self._servers.get(srv["id"], {}).get("updated_at", 0) >= ttl]
 
+    def snapshot(self) -> Dict[str, dict]:
+        """Копия кэша по серверам: {srv id: {'name', 'players', 'updated_at'}}"""
+        return {sid: dict(entry) for sid, entry in self._servers.items()}
+
+    async def get_pet_online_by_server(self, force_refresh: bool = False) -> Dict[str, List[str]]:
+        """
+        {название сервера: [ники]} из кэша — после первого скана его здесь никогда не ждём.
+        Устаревшие сервера (или все при force_refresh) обновляются фоном; на холодном старте
+        (кэш пуст) ждём идущий/первый скан, чтобы не отдать пустой онлайн.
+        """
+        if not self._servers:
+            await self.refresh(force=force_refresh)
+        elif self._stale_servers(force_refresh):
+            self.refresh_in_background(force=force_refresh)
+        return {e["name"]: list(e["players"]) for e in self._servers.values() if e["players"]}
+
+    def refresh_in_background(self, force: bool = False) -> asyncio.Task:
+        """
+        Single-flight: пока идёт скан, новый не запускается. force во время скана
+        не теряется — после текущего пройдёт ещё один полный (в той же задаче).
+        """
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._run_refreshes(force))
+        elif force:
+            self._force_pending = True
+        return self._refresh_task
+
+    async def _run_refreshes(self, force: bool):
+        await self._refresh(force)
+        while self._force_pending:
+            self._force_pending = False
+            await self._refresh(True)
+
+    async def refresh(self, force: bool = False):
+        """Задача планировщика: дожидается общего фонового обновления"""
+        await asyncio.shield(self.refresh_in_background(force=force))
+
+    async def _refresh(self, force: bool):
+        """Сканирует только устаревшие сервера"""
+        stale = self._stale_servers(force)
+        if not stale:
+            return
+        try:
+            if self._worker is not None:
+                entries = await breakers['krestgg'].call(self._worker.scan, [srv["id"] for srv in stale])
+                self._servers.update(entries)
+            else:
+                await breakers['krestgg'].call(self._scan, stale)
+        except CircuitOpenError as e:
+            logger.warning(f"⏭ {e} — остаются последние данные")
+        except Exception as e:
+            logger.error(f"❌ Глобальная ошибка парсинга: {e}")
+
+    async def _scan(self, servers: List[dict]):
+        """Сервера параллельно, каждый на своей вкладке; ошибка одного не роняет остальные"""
+        logger.info(f"🔍 Сканирую сервера: {', '.join(srv['id'] for srv in servers)} (TTL {self.current_ttl()} с)")
+        started = time.monotonic()
+
+        semaphore = asyncio.Semaphore(SCAN_CONCURRENCY)
+        async with self._browser_context() as context:
+            outcomes = await asyncio.gather(
+                *(self._scan_server(context, srv, semaphore) for srv in servers),
+                return_exceptions=True
+            )
+
+        failed = 0
+        for srv, outcome in zip(servers, outcomes):
+            if isinstance(outcome, BaseException):
+                failed += 1
+                logger.error(f"❌ Ошибка с сервером {srv['id']}: {outcome}")
+                continue  # у сервера остаются прошлые данные
+            clean_name, players = outcome or (srv["id"], [])
+            self._servers[srv["id"]] = {"name": clean_name, "players": players, "updated_at": time.time()}
+
+        if failed == len(servers):
+            self._needs_recycle = True  # браузер мог остаться в плохом состоянии
+            raise RuntimeError("krestgg: ни один сервер не отсканирован")
+
+        logger.info(f"✅ Скан за {time.monotonic() - started:.1f} с: серверов {len(servers) - failed}/{len(servers)}")
+
+    async def _scan_server(self, context, srv: dict, semaphore: asyncio.Semaphore) -> Optional[Tuple[str, List[str]]]:
+        """(название сервера, игроки [PET]) или None, если кнопки сервера нет"""
+        async with semaphore:
+            page = await context.new_page()
+            timings = {}
+            mark = time.monotonic()
+
+            def phase(name: str):
+                nonlocal mark
+                now = time.monotonic()
+                timings[name] = now - mark
+                mark = now
+
+            try:
                 await page.goto(BASE_URL, wait_until="domcontentloaded", timeout=self.timeout)
-                await page.wait_for_load_state("networkidle", timeout=10000)
-                await page.wait_for_timeout(2000)
+                phase("загрузка")
+
+                # Готовность — появилась кнопка нужного сервера, а не фиксированная пауза
+                btn = page.get_by_text(re.compile(srv["text_pattern"])).first
+                try:
+                    await btn.wait_for(state="attached", timeout=READY_TIMEOUT)
+                except PlaywrightTimeoutError:
+                    logger.debug(f"⚠️ Кнопка {srv['id']} не найдена")
+                    return None
+                phase("кнопка")
+
+                raw_name = await btn.text_content()
+                clean_name = re.sub(r'\s*\d+/\d+.*', '', raw_name).strip()
+                online = SERVER_ONLINE_RE.search(raw_name)
+                # Сколько строк ждать: онлайн с кнопки (0 — пустой сервер), без счётчика — хотя бы одну
+                expected = min(int(online.group(1)), 1) if online else 1
 
-                for srv in SERVERS_TO_CHECK:
+                # Новая вкладка открывается с сервером по умолчанию — клик по нему список не меняет
+                if await btn.evaluate(SERVER_ACTIVE_JS):
+                    logger.info(f"✅ Уже выбран: {clean_name}")
+                else:
+                    logger.info(f"🔄 Переключаю на: {clean_name}")
+                    # Подпись снимаем с дорисованного списка по умолчанию, а не с полупустой страницы
+                    await self._wait_players(page, srv['id'], 1)
+                    before = await page.evaluate(PAGE_SIGNATURE_JS)
+                    await btn.click(force=True)
                     try:
-                        btn = page.get_by_text(re.compile(srv["text_pattern"])).first
-
-                        if await btn.count() > 0:
-                            raw_name = await btn.text_content()
-                            clean_name = re.sub(r'\s*\d+/\d+.*', '', raw_name).strip()
-
-                            logger.info(f"🔄 Переключаю на: {clean_name}")
-                            await btn.click(force=True)
-                            await page.wait_for_timeout(1500)
-
-                            players = await self._extract_pet_players(page)
-                            if players:
-                                result[clean_name] = players
-                                logger.debug(f"✅ {clean_name}: {len(players)} чел.")
-                        else:
-                            logger.debug(f"⚠️ Кнопка {srv['id']} не найдена")
-
-                    except Exception as e:
-                        logger.error(f"❌ Ошибка с сервером {srv['id']}: {e}")
-                        continue
-
-                self._cache["data"] = result
-                self._cache["timestamp"] = time.time()
-                return result
-
-            except Exception as e:
-                logger.error(f"❌ Глобальная ошибка парсинга: {e}")
-                return {}
+                        await page.wait_for_function(SWITCH_SETTLED_JS, arg=[before, SETTLE_POLLS, UNCHANGED_GRACE_MS],
+                                                     polling=POLL_INTERVAL_MS, timeout=SWITCH_TIMEOUT)
+                    except PlaywrightTimeoutError:
+                        logger.debug(f"⏱ {srv['id']}: список не успокоился за {SWITCH_TIMEOUT} мс")
+                # Перед разбором — список нужного сервера дорисован (в т.ч. когда клик не понадобился)
+                await self._wait_players(page, srv['id'], expected)
+                phase("переключение")
+
+                players = await self._extract_pet_players(page)
+                phase("разбор")
+
+                logger.info(f"⏱ {srv['id']}: " + ", ".join(f"{k} {v:.2f} с" for k, v in timings.items())
+                            + f" — {len(players)} чел.")
+                return clean_name, players
             finally:
                 try:
-                    await browser.close()
-                except:
+                    await page.close()
+                except Exception:
                     pass
 
+    @staticmethod
+    async def _wait_players(page, server_id: str, expected: int):
+        """Ждёт строки игроков на странице; не дождались — разбираем то, что есть"""
+        if expected <= 0:
+            return
+        try:
+            await page.wait_for_function(PLAYERS_READY_JS, arg=[PLAYER_ROW_MARKER, expected],
+                                         polling=POLL_INTERVAL_MS, timeout=READY_TIMEOUT)
+        except PlaywrightTimeoutError:
+            logger.debug(f"⏱ {server_id}: список игроков не появился за {READY_TIMEOUT} мс")
+
     async def _extract_pet_players(self, page) -> List[str]:
-        """Парсит ники с тегом [PET], |PET| или | PET | (с пробелами)"""
+        """Парсит ники с тегом [PET], |PET| или | PET | (с пробелами) — один evaluate на страницу"""
         players = set()
         try:
-            # 🔧 ПОДДЕРЖКА ВСЕХ ФОРМАТОВ: [PET], |PET|, | PET | (с пробелами)
-            tag_pattern = re.compile(
-                r"(?:\[PET[sStTpP]?\]|\|\s*PET[sStTpP]?\s*\|)",
-                re.IGNORECASE
-            )
-
-            elements = await page.get_by_text(tag_pattern).all()
-
-            for el in elements:
-                try:
-                    text = await el.text_content()
-                    if not text: continue
-
-                    # 🔧 Извлекаем имя после тега (поддержка пробелов)
-                    match = re.search(
-                        r"(?:\[PET[sStTpP]?\]|\|\s*PET[sStTpP]?\s*\|)\s*(.+?)(?:В\s*друзья|$)",
-                        text,
-                        re.IGNORECASE | re.DOTALL
-                    )
-                    if match:
-                        nick = match.group(1).strip()
-                        nick = re.sub(r'<[^>]+>', '', nick).strip()
-
-                        if 3 <= len(nick) <= 25:
-                            players.add(nick)
-                except:
-                    continue
+            texts = await page.evaluate(EXTRACT_TAGGED_JS, PET_TAG)
         except Exception as e:
             logger.debug(f"Ошибка парсинга игроков: {e}")
+            return []
+
+        for text in texts:
+            # 🔧 Извлекаем имя после тега (поддержка пробелов)
+            match = NICK_RE.search(text)
+            if match:
+                nick = HTML_TAG_RE.sub('', match.group(1)).strip()
+                if 3 <= len(nick) <= 25:
+                    players.add(nick)
 
         return list(players)
 
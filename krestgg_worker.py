@@ -0,0 +1,173 @@
+# krestgg_worker.py
+import os
+import time
+import asyncio
+import signal
+import logging
+import multiprocessing
+from typing import Dict, List, Optional
+
+import krestgg_parser
+
+logger = logging.getLogger(__name__)
+
+USE_WORKER = os.getenv("KRESTGG_WORKER", "1") == "1"
+WORKER_MAX_RSS_MB = int(os.getenv("KRESTGG_WORKER_MAX_RSS_MB", "800"))  # воркер + Chromium
+SCAN_TIME_BUDGET = int(os.getenv("KRESTGG_SCAN_TIME_BUDGET", "120"))    # сек на один скан
+STOP_TIMEOUT = 5
+MAX_RESTART_DELAY = 60
+
+_mp = multiprocessing.get_context("spawn")
+
+
+class WorkerError(Exception):
+    """Воркер упал, превысил бюджет или вернул ошибку скана"""
+
+
+# =========================
+# 👷 ПРОЦЕСС-ВОРКЕР
+# =========================
+def _worker_main(conn, log_level: int):
+    os.setpgrp()  # своя группа процессов — при убийстве воркера уходит и Chromium
+    logging.basicConfig(level=log_level)
+    try:
+        asyncio.run(_serve(conn))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _serve(conn):
+    """Цикл воркера: ('scan', [srv id]) → ('ok', {srv id: запись}) | ('error', текст)"""
+    parser = krestgg_parser.parser
+    loop = asyncio.get_running_loop()
+    logger.info(f"👷 krestgg-воркер запущен (pid {os.getpid()})")
+    try:
+        while True:
+            try:
+                command, payload = await loop.run_in_executor(None, conn.recv)
+            except EOFError:
+                break  # главный процесс закрыл канал
+            if command == "stop":
+                break
+            if command != "scan":
+                continue
+
+            servers = [srv for srv in krestgg_parser.SERVERS_TO_CHECK if srv["id"] in payload]
+            started = time.time()
+            try:
+                await parser._scan(servers)
+                entries = {sid: entry for sid, entry in parser.snapshot().items()
+                           if sid in payload and entry["updated_at"] >= started}
+                conn.send(("ok", entries))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        await parser.close()
+
+
+# =========================
+# 📡 КЛИЕНТ В ГЛАВНОМ ПРОЦЕССЕ
+# =========================
+class KrestGGWorkerClient:
+    """
+    Держит долгоживущий процесс со своим Chromium.
+    Скан — запрос по Pipe; процесс убивается при превышении памяти или времени
+    и перезапускается при следующем запросе (с нарастающей паузой после падений).
+    """
+
+    def __init__(self, max_rss_mb: int = WORKER_MAX_RSS_MB, time_budget: float = SCAN_TIME_BUDGET):
+        self.max_rss_mb = max_rss_mb
+        self.time_budget = time_budget
+        self._process = None
+        self._conn = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._crashes = 0
+        self._next_start = 0.0
+        self.restarts = 0
+
+    def _start(self):
+        if time.monotonic() < self._next_start:
+            raise WorkerError(f"перезапуск воркера через {self._next_start - time.monotonic():.0f} с")
+        parent_conn, child_conn = _mp.Pipe()
+        self._process = _mp.Process(target=_worker_main, args=(child_conn, logging.getLogger().level),
+                                    name="krestgg-worker", daemon=True)
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+        self.restarts += 1
+        logger.info(f"👷 Запущен krestgg-воркер pid {self._process.pid}")
+
+    def _kill(self, reason: str):
+        logger.warning(f"💀 krestgg-воркер остановлен: {reason}")
+        if self._process is not None:
+            try:
+                os.killpg(self._process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+            self._process.join(STOP_TIMEOUT)
+        if self._conn is not None:
+            self._conn.close()
+        self._process = None
+        self._conn = None
+        self._crashes += 1
+        self._next_start = time.monotonic() + min(MAX_RESTART_DELAY, 2 ** self._crashes)
+
+    def _exchange(self, servers: List[str]):
+        """Блокирующий обмен — выполняется в потоке, чтобы не держать event loop"""
+        if self._process is None or not self._process.is_alive():
+            if self._process is not None:
+                self._kill(f"процесс завершился (код {self._process.exitcode})")
+            self._start()
+
+        try:
+            self._conn.send(("scan", servers))
+        except (OSError, EOFError) as e:
+            self._kill(f"канал закрыт: {e}")
+            raise WorkerError("канал с воркером закрыт")
+
+        deadline = time.monotonic() + self.time_budget
+        while True:
+            try:
+                if self._conn.poll(1.0):
+                    return self._conn.recv()
+            except (OSError, EOFError):
+                self._kill("канал закрыт во время скана")
+                raise WorkerError("воркер упал во время скана")
+
+            if not self._process.is_alive():
+                self._kill(f"процесс упал (код {self._process.exitcode})")
+                raise WorkerError("воркер упал во время скана")
+            rss = krestgg_parser.process_tree_rss_mb(self._process.pid, include_root=True)
+            if rss is not None and rss > self.max_rss_mb:
+                self._kill(f"память {rss:.0f} МБ > {self.max_rss_mb} МБ")
+                raise WorkerError("превышен бюджет памяти")
+            if time.monotonic() > deadline:
+                self._kill(f"скан дольше {self.time_budget} с")
+                raise WorkerError("превышен бюджет времени")
+
+    async def scan(self, servers: List[str]) -> Dict[str, dict]:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            status, payload = await asyncio.to_thread(self._exchange, servers)
+        if status != "ok":
+            raise WorkerError(payload)
+        self._crashes = 0
+        return payload
+
+    async def stop(self):
+        if self._process is None:
+            return
+        try:
+            self._conn.send(("stop", None))
+        except (OSError, EOFError):
+            pass
+        await asyncio.to_thread(self._process.join, STOP_TIMEOUT)
+        if self._process.is_alive():
+            try:
+                os.killpg(self._process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+        self._process = None
+        self._conn = None
+        logger.info("👷 krestgg-воркер остановлен")
@@ -6,9 +6,6 @@ import threading
 from aiogram.utils.executor import start_polling
 import uvicorn
 
-# Импортируем бота и диспетчер из bot.py
-from bot import bot, dp, on_startup, on_shutdown
-
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -16,6 +13,7 @@ logger = logging.getLogger(__name__)
 def run_bot():
     """Запускает бота в отдельном потоке с собственным event loop"""
     logger.info("🤖 Запуск бота в потоке...")
+    from bot import dp, on_startup, on_shutdown  # модуль уже загружен в main()
 
     # Создаём новый event loop для этого потока
     loop = asyncio.new_event_loop()
@@ -55,6 +53,10 @@ def main():
     """Точка входа"""
     logger.info("🚀 Запуск PET Bot + Mini App...")
 
+    # bot.py импортируется здесь, а не на уровне модуля: spawn-воркер krestgg исполняет
+    # main.py как __mp_main__ и иначе поднимал бы весь бот (Sheets, Dispatcher, хендлеры)
+    import bot  # noqa: F401
+
     # Запускаем бота в отдельном потоке
     bot_thread = threading.Thread(target=run_bot, daemon=True)
     bot_thread.start()
@@ -0,0 +1,91 @@
+# media_cache.py
+import os
+import json
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+MEDIA_CACHE_PATH = os.getenv("MEDIA_CACHE_PATH", "media_cache.json")
+
+
+class MediaCache:
+    """
+    Кэш file_id Telegram для повторно отправляемых медиа.
+    Ключ — URL или локальный файл (с размером и mtime, чтобы замена файла
+    сбрасывала кэш). Хранится в JSON на диске и переживает перезапуск.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_local_file(source) -> bool:
+        return isinstance(source, str) and not source.startswith(("http://", "https://")) and os.path.isfile(source)
+
+    def key_for(self, source) -> Optional[str]:
+        """Ключ кэша или None, если source уже file_id / поток"""
+        if not isinstance(source, str):
+            return None
+        if source.startswith(("http://", "https://")):
+            return source
+        if self.is_local_file(source):
+            st = os.stat(source)
+            return f"file:{os.path.abspath(source)}:{st.st_size}:{int(st.st_mtime)}"
+        return None
+
+    def _load(self):
+        if self._data is not None:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._data = json.load(f)
+        except FileNotFoundError:
+            self._data = {}
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось прочитать кэш медиа: {e}")
+            self._data = {}
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить кэш медиа: {e}")
+
+    def get(self, source) -> Optional[str]:
+        key = self.key_for(source)
+        if not key:
+            return None
+        with self._lock:
+            self._load()
+            return self._data.get(key)
+
+    def put(self, source, file_id: str):
+        key = self.key_for(source)
+        if not key or not file_id:
+            return
+        with self._lock:
+            self._load()
+            if self._data.get(key) == file_id:
+                return
+            self._data[key] = file_id
+            self._save()
+        logger.info(f"🖼 file_id закэширован для {key[:80]}")
+
+    def forget(self, source):
+        key = self.key_for(source)
+        if not key:
+            return
+        with self._lock:
+            self._load()
+            if self._data.pop(key, None) is not None:
+                self._save()
+
+
+media_cache = MediaCache(MEDIA_CACHE_PATH)
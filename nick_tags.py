@@ -0,0 +1,31 @@
+# nick_tags.py
+import re
+
+# Единая грамматика тега клана: [PET], |PET|, (PET), с пробелами, PETs/PETt/PETp,
+# а также кириллическое «РЕТ». Строка PET_TAG совместима с RegExp в JS (evaluate в playwright).
+_TAG_WORD = r"(?:PET|РЕТ)[sStTpP]?"
+PET_TAG = rf"(?:\[\s*{_TAG_WORD}\s*\]|\|\s*{_TAG_WORD}\s*\||\(\s*{_TAG_WORD}\s*\))"
+
+# «Голый» тег в начале ника вместе с разделителем: "PET Vasya", "PET|Vasya", "PET] Vasya", "PET_Vasya".
+# Одно выражение и для проверки, и для очистки — has_tag и strip_tag понимают одни и те же формы
+_LEADING_TAG = rf"^\s*{_TAG_WORD}(?:\s*[|\]):_\-]\s*|\b)"
+_TAG_RE = re.compile(rf"{PET_TAG}|{_LEADING_TAG}", re.IGNORECASE)
+_SPACES_RE = re.compile(r"\s+")
+
+
+def has_tag(nick: str) -> bool:
+    """'[PET] Vasya', 'PET Vasya', 'PET_Vasya', 'PET|Vasya', 'РЕТ Вася' → True; 'Petrov' → False"""
+    return bool(_TAG_RE.search(nick))
+
+
+def strip_tag(nick: str) -> str:
+    """
+    '[PET] Vasya', '|PETs| Vasya', 'PET Vasya', 'PET|Vasya', 'PET] Vasya', 'PET_Vasya' → 'Vasya';
+    'Petrov', 'Trumpet' — без изменений
+    """
+    return _SPACES_RE.sub(" ", _TAG_RE.sub("", nick)).strip()
+
+
+def nick_key(nick: str) -> str:
+    """Ключ для сравнения ников из разных источников и таблицы"""
+    return strip_tag(nick).casefold()
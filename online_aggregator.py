@@ -0,0 +1,140 @@
+# online_aggregator.py
+import html
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import pytz
+
+from clan_online import clan_online
+from krestgg_parser import parser as krest_parser
+from nick_tags import strip_tag, nick_key
+
+logger = logging.getLogger(__name__)
+
+ROSTER_TTL = 300  # как часто перечитываем список участников из таблицы, сек
+
+SOURCE_NAMES = {'sqstat': 'SQStat', 'krestgg': 'krestgg'}
+
+
+class OnlineAggregator:
+    """
+    Общий онлайн клана из sqstat (clan.php) и krestgg.
+    Оба источника читаются из своих кэшей; ники приводятся к одному ключу
+    (nick_tags), дубли склеиваются, игроки сопоставляются с участниками по индексу.
+    """
+
+    def __init__(self):
+        self._roster_loader: Optional[Callable[[], List[str]]] = None
+        self._roster_index: Dict[str, str] = {}
+        self._roster_loaded_at = 0.0
+
+    def set_roster_loader(self, loader: Callable[[], List[str]]):
+        """loader() → ники участников (лист «участники клана»)"""
+        self._roster_loader = loader
+
+    # =========================
+    # 👥 ИНДЕКС УЧАСТНИКОВ
+    # =========================
+    def _roster_stale(self) -> bool:
+        return self._roster_loader is not None and time.monotonic() - self._roster_loaded_at > ROSTER_TTL
+
+    def _reload_roster(self):
+        try:
+            self._roster_index = {nick_key(nick): nick.strip() for nick in self._roster_loader() if nick.strip()}
+            self._roster_loaded_at = time.monotonic()
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось обновить список участников: {e}")
+
+    # =========================
+    # 🔀 СЛИЯНИЕ
+    # =========================
+    def build_view(self, sqstat_snapshot: Optional[dict], krest_snapshot: Dict[str, dict]) -> dict:
+        players: Dict[str, dict] = {}
+
+        def add(raw_nick: str, source: str, server: str):
+            key = nick_key(raw_nick)
+            if not key:
+                return
+            entry = players.get(key)
+            if entry is None:
+                entry = players[key] = {
+                    'nick': strip_tag(raw_nick),
+                    'member': self._roster_index.get(key),
+                    'sources': [],
+                    'servers': [],
+                }
+            if source not in entry['sources']:
+                entry['sources'].append(source)
+            if server not in entry['servers']:
+                entry['servers'].append(server)
+
+        for p in (sqstat_snapshot or {}).get('players', []):
+            add(p['nick'], 'sqstat', p['server'])
+        for entry in krest_snapshot.values():
+            for nick in entry['players']:
+                add(nick, 'krestgg', entry['name'])
+
+        krest_times = [e['updated_at'] for e in krest_snapshot.values()]
+        merged = sorted(players.values(), key=lambda p: p['nick'].casefold())
+        return {
+            'players': merged,
+            'total': len(merged),
+            'sources': {
+                'sqstat': sqstat_snapshot['fetched_at'] if sqstat_snapshot else None,
+                'krestgg': min(krest_times) if krest_times else None,
+            },
+        }
+
+    async def get_view(self) -> dict:
+        """Для бота: оба источника параллельно, каждый из своего кэша"""
+        async def sqstat():
+            try:
+                return await clan_online.get_snapshot()
+            except Exception as e:
+                logger.warning(f"⚠️ [Онлайн] sqstat недоступен: {e}")
+                return None
+
+        async def krestgg():
+            await krest_parser.get_pet_online_by_server()  # кэш (на холодном старте — первый скан), устаревшее обновится фоном
+            return krest_parser.snapshot()
+
+        sqstat_snapshot, krest_snapshot, _ = await asyncio.gather(sqstat(), krestgg(), self.refresh_roster())
+        return self.build_view(sqstat_snapshot, krest_snapshot)
+
+    async def refresh_roster(self):
+        """Перечитывает список участников, если устарел (таблица — в потоке, loop свободен)"""
+        if self._roster_stale():
+            await asyncio.to_thread(self._reload_roster)
+
+    def peek_view(self) -> dict:
+        """
+        Для API: только то, что уже лежит в памяти, без запросов.
+        Список участников обновляет бот (get_view, отсчёт журнала присутствия).
+        """
+        return self.build_view(clan_online.peek_snapshot(), krest_parser.snapshot())
+
+
+def render_view(view: dict) -> Optional[str]:
+    if not view['players']:
+        return None
+
+    lines = [f"🟢 <b>Клан [PET] онлайн: {view['total']}</b>\n"]
+    for p in view['players']:
+        nick = html.escape(p['nick'])
+        mark = "👤" if p['member'] else "❔"
+        servers = html.escape(", ".join(p['servers']))
+        lines.append(f"{mark} <code>{nick}</code> — {servers}")
+
+    msk = pytz.timezone("Europe/Moscow")
+    updated = []
+    for source, ts in view['sources'].items():
+        if ts:
+            updated.append(f"{SOURCE_NAMES[source]} {datetime.fromtimestamp(ts, msk).strftime('%H:%M')}")
+    lines.append(f"\n📊 <i>👤 — в списке клана | Данные: {', '.join(updated) or 'нет'}</i>")
+    return "\n".join(lines)
+
+
+online_aggregator = OnlineAggregator()
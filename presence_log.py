@@ -0,0 +1,232 @@
+# presence_log.py
+import os
+import json
+import mmap
+import struct
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from nick_tags import nick_key
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_LOG_PATH = os.getenv("PRESENCE_LOG_PATH", "presence.log")
+# 1 000 000 записей × 7 байт ≈ 7 МБ: месяцы поминутных отсчётов при типичном онлайне клана
+PRESENCE_CAPACITY = int(os.getenv("PRESENCE_CAPACITY", "1000000"))
+
+MAGIC = b"PETP"
+VERSION = 1
+HEADER = struct.Struct("<4sHxxIQ")   # magic, версия, ёмкость, всего записано
+RECORD = struct.Struct("<IBH")       # unix-время, id сервера, id игрока
+MSK_OFFSET = 3 * 3600                # МСК без перехода на летнее время
+SAMPLE_INTERVAL = 60                 # период отсчётов, сек (пустые отсчёты не пишутся)
+
+
+class PresenceLog:
+    """
+    Журнал присутствия: кольцевой буфер фиксированных записей (время, сервер, игрок)
+    в memory-mapped файле. Ники и сервера интернируются в маленькие id (JSON рядом).
+    Записи идут по возрастанию времени — диапазоны ищутся бинарным поиском,
+    «когда был в сети» хранится в памяти и обновляется при добавлении.
+    """
+
+    def __init__(self, path: str, capacity: int):
+        self.path = path
+        self.capacity = capacity
+        self.names_path = f"{path}.names.json"
+        self._lock = threading.Lock()
+        self._mm: Optional[mmap.mmap] = None
+        self._total = 0
+        self._players: List[str] = []
+        self._player_ids: Dict[str, int] = {}
+        self._servers: List[str] = []
+        self._server_ids: Dict[str, int] = {}
+        self._last_seen: Dict[int, Tuple[int, int]] = {}  # id игрока → (время, id сервера)
+
+    # =========================
+    # 💾 ФАЙЛЫ
+    # =========================
+    def _open(self):
+        if self._mm is not None:
+            return
+        size = HEADER.size + self.capacity * RECORD.size
+        fresh = not os.path.exists(self.path) or os.path.getsize(self.path) != size
+        with open(self.path, "a+b") as f:
+            f.truncate(size)
+            self._mm = mmap.mmap(f.fileno(), size)
+
+        magic, version, capacity, total = HEADER.unpack_from(self._mm, 0)
+        if fresh or magic != MAGIC or version != VERSION or capacity != self.capacity:
+            if not fresh:
+                logger.warning("⚠️ Журнал присутствия другого формата — начинаю заново")
+            total = 0
+            HEADER.pack_into(self._mm, 0, MAGIC, VERSION, self.capacity, 0)
+        self._total = total
+        self._load_names()
+        self._rebuild_last_seen()
+
+    def _load_names(self):
+        try:
+            with open(self.names_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._players = data.get("players", [])
+            self._servers = data.get("servers", [])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось прочитать имена журнала присутствия: {e}")
+        self._player_ids = {nick_key(n): i for i, n in enumerate(self._players)}
+        self._server_ids = {s: i for i, s in enumerate(self._servers)}
+
+    def _save_names(self):
+        tmp_path = f"{self.names_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"players": self._players, "servers": self._servers}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.names_path)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить имена журнала присутствия: {e}")
+
+    def _rebuild_last_seen(self):
+        self._last_seen = {}
+        for ts, server_id, player_id in self._iter_range(0, self._count()):
+            self._last_seen[player_id] = (ts, server_id)
+
+    # =========================
+    # 🔢 КОЛЬЦО
+    # =========================
+    def _count(self) -> int:
+        return min(self._total, self.capacity)
+
+    def _offset(self, logical: int) -> int:
+        """logical 0 — самая старая из хранимых записей"""
+        first = self._total - self._count()
+        return HEADER.size + ((first + logical) % self.capacity) * RECORD.size
+
+    def _ts_at(self, logical: int) -> int:
+        return struct.unpack_from("<I", self._mm, self._offset(logical))[0]
+
+    def _bisect(self, ts: int) -> int:
+        """Первая запись со временем >= ts"""
+        lo, hi = 0, self._count()
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._ts_at(mid) < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _iter_range(self, start: int, stop: int) -> Iterator[Tuple[int, int, int]]:
+        """Записи [start, stop) по логическим индексам — не больше двух непрерывных кусков"""
+        while start < stop:
+            offset = self._offset(start)
+            chunk = min(stop - start, (HEADER.size + self.capacity * RECORD.size - offset) // RECORD.size)
+            yield from RECORD.iter_unpack(self._mm[offset:offset + chunk * RECORD.size])
+            start += chunk
+
+    def _intern(self, name: str, names: List[str], ids: Dict[str, int], key: str, limit: int) -> Optional[int]:
+        idx = ids.get(key)
+        if idx is None:
+            if len(names) >= limit:
+                return None
+            idx = len(names)
+            names.append(name)
+            ids[key] = idx
+        return idx
+
+    # =========================
+    # ✍️ ЗАПИСЬ
+    # =========================
+    def append_sample(self, ts: int, players: List[Tuple[str, str]]):
+        """Один отсчёт: [(сервер, ник)] — все, кто в сети в момент ts"""
+        if not players:
+            return
+        with self._lock:
+            self._open()
+            names_changed = False
+            for server, nick in players:
+                known = len(self._players) + len(self._servers)
+                server_id = self._intern(server, self._servers, self._server_ids, server, 0xFF)
+                player_id = self._intern(nick, self._players, self._player_ids, nick_key(nick), 0xFFFF)
+                names_changed |= len(self._players) + len(self._servers) != known
+                if server_id is None or player_id is None:
+                    continue
+                offset = HEADER.size + (self._total % self.capacity) * RECORD.size
+                RECORD.pack_into(self._mm, offset, ts, server_id, player_id)
+                self._total += 1
+                self._last_seen[player_id] = (ts, server_id)
+            HEADER.pack_into(self._mm, 0, MAGIC, VERSION, self.capacity, self._total)
+            if names_changed:
+                self._save_names()
+
+    def flush(self):
+        with self._lock:
+            if self._mm is not None:
+                self._mm.flush()
+
+    # =========================
+    # 🔎 ЗАПРОСЫ
+    # =========================
+    def range(self, start_ts: int, end_ts: int) -> List[Tuple[int, str, str]]:
+        """(время, сервер, ник) с start_ts включительно до end_ts не включая"""
+        with self._lock:
+            self._open()
+            lo, hi = self._bisect(start_ts), self._bisect(end_ts)
+            return [(ts, self._servers[s], self._players[p]) for ts, s, p in self._iter_range(lo, hi)]
+
+    def last_seen(self, nick: str) -> Optional[Tuple[int, str, str]]:
+        """(время, сервер, ник) последнего появления или None"""
+        with self._lock:
+            self._open()
+            player_id = self._player_ids.get(nick_key(nick))
+            if player_id is None or player_id not in self._last_seen:
+                return None
+            ts, server_id = self._last_seen[player_id]
+            return ts, self._servers[server_id], self._players[player_id]
+
+    def player_minutes(self, start_ts: int, end_ts: int) -> List[Tuple[str, int]]:
+        """Кто играл в интервале: [(ник, отсчётов ≈ минут)] по убыванию"""
+        with self._lock:
+            self._open()
+            lo, hi = self._bisect(start_ts), self._bisect(end_ts)
+            counts = Counter(p for _, _, p in self._iter_range(lo, hi))
+            return [(self._players[p], n) for p, n in counts.most_common()]
+
+    def heatmap(self, start_ts: int, end_ts: int) -> List[float]:
+        """Средний онлайн по часам суток (МСК), 24 значения"""
+        with self._lock:
+            self._open()
+            if not self._count():
+                return [0.0] * 24
+            start_ts = max(start_ts, self._ts_at(0))  # раньше журнала данных нет
+            lo, hi = self._bisect(start_ts), self._bisect(end_ts)
+            records = [0] * 24
+            for ts, _, _ in self._iter_range(lo, hi):
+                records[(ts + MSK_OFFSET) // 3600 % 24] += 1
+
+        # Пустые отсчёты не пишутся — делим на число отсчётов, которое успело пройти за час суток
+        slots = [0] * 24
+        hour_start = (start_ts + MSK_OFFSET) // 3600 * 3600 - MSK_OFFSET
+        while hour_start < end_ts:
+            covered = min(end_ts, hour_start + 3600) - max(start_ts, hour_start)
+            slots[(hour_start + MSK_OFFSET) // 3600 % 24] += covered / SAMPLE_INTERVAL
+            hour_start += 3600
+        return [records[h] / slots[h] if slots[h] else 0.0 for h in range(24)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._open()
+            return {
+                'records': self._count(),
+                'capacity': self.capacity,
+                'players': len(self._players),
+                'servers': len(self._servers),
+                'oldest': self._ts_at(0) if self._count() else None,
+                'file_bytes': HEADER.size + self.capacity * RECORD.size,
+            }
+
+
+presence_log = PresenceLog(PRESENCE_LOG_PATH, PRESENCE_CAPACITY)
@@ -0,0 +1,186 @@
+# sqstat_leaderboard.py
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqstat_profiles import get_sqstat_profile, is_fresh
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_PATH = os.getenv("SQSTAT_LEADERBOARD_PATH", "sqstat_leaderboard.json")
+
+FETCH_CONCURRENCY = 3      # одновременных запросов к sqstat
+POLITENESS_DELAY = 1.5     # минимум секунд между стартами запросов к хосту
+REFRESH_BATCH = 15         # профилей за один запуск планировщика
+REFRESH_INTERVAL = 600     # период задачи планировщика, сек
+MIN_MATCHES = 10           # без этого K/D и винрейт — шум
+MAX_BACKOFF = 6 * 3600     # предел паузы для профиля, который не обновляется, сек
+
+METRICS = {
+    # метрика → (поле, название)
+    'kd': ('kd', 'K/D'),
+    'winrate': ('winrate', 'Винрейт'),
+    'playtime': ('playtime_minutes', 'Время в игре'),
+}
+
+
+def _to_float(value) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return float(str(value).replace('%', '').replace(' ', ''))
+    except ValueError:
+        return None
+
+
+class _HostThrottle:
+    """Не чаще одного старта запроса в POLITENESS_DELAY секунд"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._lock = asyncio.Lock()
+        self._next_start = 0.0
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            if self._next_start > now:
+                await asyncio.sleep(self._next_start - now)
+            self._next_start = time.monotonic() + self.delay
+
+
+class SqstatLeaderboard:
+    """
+    Рейтинг клана по статистике sqstat.
+    Профили собираются порциями (сначала самые старые), с ограничением
+    параллельности и паузами между запросами; результат хранится в JSON.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Optional[Dict[str, dict]] = None
+        self._lock = threading.Lock()
+        self._refresh_lock: Optional[asyncio.Lock] = None
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            self._entries = {}
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось прочитать лидерборд: {e}")
+            self._entries = {}
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить лидерборд: {e}")
+
+    def entries(self) -> List[dict]:
+        with self._lock:
+            self._load()
+            return list(self._entries.values())
+
+    def _pick_stale(self, members: Dict[str, str], limit: int) -> List[str]:
+        """
+        steam_id для обновления: новые участники, затем давнее всех проверенные.
+        Профили, которые не обновились, ждут своей паузы (retry_at) и не занимают порцию.
+        """
+        now = time.time()
+        with self._lock:
+            self._load()
+            # Вышедшие из клана больше не участвуют в рейтинге
+            for steam_id in set(self._entries) - set(members):
+                del self._entries[steam_id]
+
+            def checked_at(sid: str) -> float:
+                entry = self._entries.get(sid, {})
+                return entry.get('checked_at', entry.get('updated_at', 0))
+
+            due = [sid for sid in members if self._entries.get(sid, {}).get('retry_at', 0) <= now]
+            return sorted(due, key=checked_at)[:limit]
+
+    def _mark_failed(self, steam_id: str, nick: str, now: float):
+        """Профиль не загрузился: экспоненциальная пауза, чтобы не занимать порцию"""
+        entry = self._entries.setdefault(steam_id, {'steam_id': steam_id, 'nick': nick})
+        entry['failures'] = entry.get('failures', 0) + 1
+        entry['checked_at'] = now
+        entry['retry_at'] = now + min(MAX_BACKOFF, REFRESH_INTERVAL * 2 ** (entry['failures'] - 1))
+
+    async def refresh(self, members: Iterable[Tuple[str, str]], limit: int = REFRESH_BATCH) -> int:
+        """
+        members — пары (ник, steam_id) из таблицы участников.
+        Обновляет до limit самых старых записей; возвращает число обновлённых.
+        """
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        if self._refresh_lock.locked():
+            return 0  # предыдущий запуск ещё идёт
+
+        async with self._refresh_lock:
+            members = {steam_id: nick for nick, steam_id in members if steam_id and steam_id.isdigit()}
+            batch = self._pick_stale(members, limit)
+            if not batch:
+                return 0
+
+            semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+            throttle = _HostThrottle(POLITENESS_DELAY)
+
+            async def collect(steam_id: str):
+                async with semaphore:
+                    if not is_fresh(steam_id):
+                        await throttle.wait()
+                    # Ждём настоящую загрузку внутри семафора и паузы — устаревший профиль не подходит
+                    return steam_id, await get_sqstat_profile(steam_id, allow_stale=False)
+
+            started = time.monotonic()
+            results = await asyncio.gather(*(collect(sid) for sid in batch))
+
+            updated = 0
+            now = time.time()
+            with self._lock:
+                for steam_id, stats in results:
+                    if stats is None:
+                        self._mark_failed(steam_id, members[steam_id], now)  # sqstat не ответил
+                        continue
+                    entry = self._entries.setdefault(steam_id, {'steam_id': steam_id})
+                    entry.update({
+                        'nick': members[steam_id],
+                        'kd': _to_float(stats.get('kd')),
+                        'winrate': _to_float(stats.get('winrate')),
+                        'playtime_minutes': stats.get('playtime_minutes'),
+                        'kills': _to_float(stats.get('kills')),
+                        'matches': _to_float(stats.get('matches')),
+                        'updated_at': stats.get('fetched_at', now),
+                        'checked_at': now,
+                    })
+                    entry.pop('failures', None)
+                    entry.pop('retry_at', None)
+                    updated += 1
+                self._save()
+
+            logger.info(f"🏅 [Лидерборд] Обновлено {updated}/{len(batch)} за {time.monotonic() - started:.1f} с")
+            return updated
+
+    def ranking(self, metric: str = 'kd', limit: int = 10) -> List[dict]:
+        """Отсортированный рейтинг; для K/D и винрейта — только с MIN_MATCHES+ матчей"""
+        field, _ = METRICS[metric]
+        rows = [e for e in self.entries() if e.get(field) is not None]
+        if metric in ('kd', 'winrate'):
+            rows = [e for e in rows if (e.get('matches') or 0) >= MIN_MATCHES]
+        rows.sort(key=lambda e: e[field], reverse=True)
+        return rows[:limit]
+
+
+leaderboard = SqstatLeaderboard(LEADERBOARD_PATH)
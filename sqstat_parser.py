@@ -0,0 +1,158 @@
+# sqstat_parser.py
+import re
+import logging
+from typing import Dict, Iterator, List, Optional
+
+from lxml import etree
+from lxml import html as lxml_html
+
+logger = logging.getLogger(__name__)
+
+# Текст этих элементов в статистику не входит
+SKIP_ELEMENTS = ('script', 'style', 'noscript', 'template', etree.Comment)
+
+# Метка на странице → ключ в результате
+NUMERIC_LABELS = {
+    'К/Д': 'kd',
+    'ВИНРЕЙТ': 'winrate',
+    'УБИЙСТВА': 'kills',
+    'СМЕРТИ': 'deaths',
+    'УРОН': 'damage',
+    'ПОДНЯТИЯ': 'revives',
+    'МАТЧЕЙ': 'matches',
+    'ПОБЕД': 'wins',
+    'ПРОИГРЫШЕЙ': 'losses',
+    'ОНЛАЙН': 'playtime',
+}
+PERCENT_KEYS = {'winrate'}
+
+WEAPON_NAMES = ['M16A4', 'M4A1', 'AK-12', 'AKM', 'SCAR-H', 'QBZ-03', 'AUG-A3', 'MP7', 'M249', 'PKM']
+MAP_NAMES = ['Gorodok', 'Breakwater', 'Lashkar', 'Khanji', 'Tallil', 'Yehorivka', 'Fallujah']
+
+MAX_WEAPONS = 3
+MAX_MATCHES = 3
+
+# 🔹 Все паттерны компилируются один раз при импорте
+LABEL_RE = re.compile(
+    r'(' + '|'.join(re.escape(label) for label in sorted(NUMERIC_LABELS, key=len, reverse=True)) + r')\s*:?\s*(.*)',
+    re.IGNORECASE
+)
+NUMBER_RE = re.compile(r'^[\d\s,]+\.?\d*')
+PERCENT_RE = re.compile(r'^[\d\s,]+\.?\d*%')
+NOT_NUMERIC_RE = re.compile(r'[^\d.,%]')
+DIGITS_RE = re.compile(r'\d+')
+WEAPON_RE = re.compile('|'.join(re.escape(w) for w in WEAPON_NAMES), re.IGNORECASE)
+MAP_RE = re.compile('|'.join(re.escape(m) for m in MAP_NAMES))
+WIN_RE = re.compile(r'победа|да|выигрыш')
+LOSS_RE = re.compile(r'пораж|нет|проигр')
+
+_LABEL_KEYS = {label.upper(): key for label, key in NUMERIC_LABELS.items()}
+
+
+def iter_lines(doc) -> Iterator[str]:
+    """Непустые строки видимого текста документа по порядку"""
+    for chunk in doc.itertext():
+        if '\n' in chunk:
+            for part in chunk.split('\n'):
+                part = part.strip()
+                if part:
+                    yield part
+        else:
+            chunk = chunk.strip()
+            if chunk:
+                yield chunk
+
+
+def _numeric(raw: str, allow_percent: bool) -> Optional[str]:
+    """'54,1%' → '54.1%', '12 345' → '12345'; None если это не число"""
+    match = (PERCENT_RE if allow_percent else NUMBER_RE).match(raw)
+    if not match:
+        return None
+    cleaned = NOT_NUMERIC_RE.sub('', match.group(0))
+    if cleaned and cleaned.replace('.', '').replace(',', '').replace('%', '').isdigit():
+        return cleaned.replace(',', '.')
+    return None
+
+
+def format_playtime(total_minutes: int) -> str:
+    hours, minutes = divmod(total_minutes, 60)
+    return f"{hours}ч {minutes:02d}м" if hours > 0 else f"{minutes}м"
+
+
+def parse_profile(page_html: str) -> Dict:
+    """
+    Разбирает страницу игрока sqstat за один проход по строкам текста.
+    Формат результата совпадает со старым парсером из bot.py
+    плюс playtime_minutes (int или None).
+    """
+    doc = lxml_html.fromstring(page_html)
+    etree.strip_elements(doc, *SKIP_ELEMENTS, with_tail=False)
+    lines: List[str] = list(iter_lines(doc))
+
+    stats: Dict = {key: None for key in NUMERIC_LABELS.values()}
+    raw_playtime_text = None
+    weapons: List[dict] = []
+    matches: List[dict] = []
+    seen_maps = set()
+    pending_key = None  # метка без значения — значение в следующей строке
+
+    for idx, line in enumerate(lines):
+        # 🔹 Значение для метки из предыдущей строки
+        if pending_key is not None:
+            key, pending_key = pending_key, None
+            stats[key] = _numeric(line, key in PERCENT_KEYS)
+            if key == 'playtime' and stats[key] is None:
+                raw_playtime_text = line
+
+        # 🔹 Метки метрик
+        label_match = LABEL_RE.search(line)
+        if label_match:
+            key = _LABEL_KEYS[label_match.group(1).upper()]
+            if stats[key] is None:
+                rest = label_match.group(2)
+                if rest:
+                    stats[key] = _numeric(rest, key in PERCENT_KEYS)
+                    if key == 'playtime' and stats[key] is None:
+                        raw_playtime_text = rest
+                else:
+                    pending_key = key
+
+        # 🔹 Топ оружие
+        if len(weapons) < MAX_WEAPONS:
+            weapon_match = WEAPON_RE.search(line)
+            if weapon_match:
+                nums = DIGITS_RE.findall(line)
+                if nums:
+                    weapons.append({'name': weapon_match.group(0).upper(), 'kills': nums[-1]})
+
+        # 🔹 Последние карты
+        if len(matches) < MAX_MATCHES and MAP_RE.search(line):
+            map_name = line[:30]
+            if map_name not in seen_maps:
+                context = ' '.join(lines[max(0, idx - 2):idx + 3]).lower()
+                if WIN_RE.search(context):
+                    result = "✅"
+                elif LOSS_RE.search(context):
+                    result = "❌"
+                else:
+                    result = "⚪"
+                matches.append({'map': map_name, 'result': result})
+                seen_maps.add(map_name)
+
+    # 🔹 Время в игре: на сайте — минуты
+    raw_playtime = stats.pop('playtime')
+    stats['playtime_minutes'] = None
+    if raw_playtime:
+        try:
+            stats['playtime_minutes'] = int(float(raw_playtime))
+            stats['playtime'] = format_playtime(stats['playtime_minutes'])
+        except ValueError:
+            stats['playtime'] = raw_playtime
+    elif raw_playtime_text and any(c.isdigit() for c in raw_playtime_text):
+        stats['playtime'] = raw_playtime_text[:20]  # уже в виде "44ч 05м"
+    else:
+        stats['playtime'] = None
+
+    stats['top_weapons'] = weapons
+    stats['recent_matches'] = matches
+    return stats
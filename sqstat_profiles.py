@@ -0,0 +1,68 @@
+# sqstat_profiles.py
+import os
+import time
+import logging
+from typing import Optional
+
+import http_client
+from circuit_breaker import breakers, CircuitOpenError
+from sqstat_parser import parse_profile
+from swr_cache import SWRCache
+
+logger = logging.getLogger(__name__)
+
+PROFILE_URL = "https://breaking.proxy.sqstat.ru/player/{steam_id}"
+
+SQSTAT_PROFILE_TTL = int(os.getenv("SQSTAT_PROFILE_TTL", "600"))              # свежесть профиля, сек
+SQSTAT_PROFILE_STALE_TTL = int(os.getenv("SQSTAT_PROFILE_STALE_TTL", "3600"))  # старый профиль + фоновое обновление
+SQSTAT_REFRESH_MIN_AGE = 60   # «🔄 Обновить» не ходит в sqstat чаще раза в минуту
+SQSTAT_SOFT_TIMEOUT = 4       # сколько ждём sqstat, если есть старые данные
+
+# Кэш профилей по steam_id — общий для профиля в боте и лидерборда
+profile_cache = SWRCache(ttl=SQSTAT_PROFILE_TTL, stale_ttl=SQSTAT_PROFILE_STALE_TTL,
+                         soft_timeout=SQSTAT_SOFT_TIMEOUT)
+
+
+def is_fresh(steam_id: str) -> bool:
+    """Есть ли свежий профиль — тогда get_sqstat_profile не пойдёт в сеть"""
+    _, age = profile_cache.peek(steam_id)
+    return age is not None and age < SQSTAT_PROFILE_TTL
+
+
+async def get_sqstat_profile(steam_id: str, force: bool = False, allow_stale: bool = True) -> Optional[dict]:
+    """
+    Профиль sqstat из кэша по steam_id; одновременные запросы = одна загрузка.
+    allow_stale=False — только свежий профиль (при необходимости ждём загрузку),
+    None при ошибке загрузки: для лидерборда, которому важно, обновились ли данные.
+    """
+    max_age = SQSTAT_REFRESH_MIN_AGE if force else None
+    try:
+        return await profile_cache.get(steam_id, lambda: _load_sqstat_profile(steam_id),
+                                       max_age=max_age, allow_stale=allow_stale)
+    except Exception as e:
+        logger.warning(f"⚠️ sqstat профиль {steam_id}: {e}")
+        return None
+
+
+async def _load_sqstat_profile(steam_id: str) -> dict:
+    stats = await fetch_sqstat_profile(steam_id)
+    if stats is None:
+        raise RuntimeError("sqstat не вернул профиль")  # неудачу не кэшируем
+    # Копия: на 304 http_client отдаёт тот же объект
+    return {**stats, 'fetched_at': time.time()}
+
+
+async def fetch_sqstat_profile(steam_id: str) -> Optional[dict]:
+    """Парсит статистику с breaking.proxy.sqstat.ru/player/{steam_id}"""
+    url = PROFILE_URL.format(steam_id=steam_id)
+
+    try:
+        # Не изменилась страница (304) — берём уже разобранный профиль
+        return await breakers['sqstat'].call(http_client.get_conditional, url, parse_profile)
+
+    except CircuitOpenError as e:
+        logger.debug(f"⏭ {e}")
+        return None
+    except Exception as e:
+        logger.error(f"❌ sqstat parse error: {e}")
+        return None
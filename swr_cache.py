@@ -0,0 +1,86 @@
+# swr_cache.py
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SWRCache:
+    """
+    TTL-кэш со stale-while-revalidate и single-flight загрузкой.
+    - свежее значение (моложе ttl) отдаётся сразу;
+    - устаревшее (моложе ttl + stale_ttl) отдаётся сразу, обновление идёт фоном;
+    - одновременные промахи по одному ключу ждут одну и ту же загрузку;
+    - если загрузка падает или дольше soft_timeout — отдаётся любое старое значение.
+    Работает в пределах одного event loop.
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float = 0, soft_timeout: Optional[float] = None):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.soft_timeout = soft_timeout
+        self._entries: Dict[Hashable, Tuple[Any, float]] = {}
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    def peek(self, key: Hashable) -> Tuple[Any, Optional[float]]:
+        """(значение, возраст в секундах) без загрузки; (None, None) если пусто"""
+        entry = self._entries.get(key)
+        if not entry:
+            return None, None
+        return entry[0], time.monotonic() - entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (value, time.monotonic())
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def refresh(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """Запускает загрузку (или возвращает уже идущую)"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key, loader))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._on_done(k, t))
+        return task
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]):
+        value = await loader()
+        self.set(key, value)
+        return value
+
+    def _on_done(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"⚠️ Обновление кэша {key!r} не удалось: {task.exception()}")
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]], max_age: Optional[float] = None,
+                  allow_stale: bool = True):
+        """
+        max_age — явное «обновить»: значение старше max_age не отдаётся как свежее,
+        а ждётся загрузка (общая для всех одновременных запросов).
+        allow_stale=False — только свежее или настоящая загрузка: старое значение не отдаётся
+        ни вместо загрузки, ни после её ошибки или soft_timeout (ошибка уходит вызывающему).
+        """
+        value, age = self.peek(key)
+        fresh_for = self.ttl if max_age is None else min(self.ttl, max_age)
+        if age is not None and age < fresh_for:
+            return value
+        if allow_stale and max_age is None and age is not None and age < self.ttl + self.stale_ttl:
+            self.refresh(key, loader)
+            return value
+
+        task = self.refresh(key, loader)
+        if not allow_stale:
+            return await asyncio.shield(task)
+        try:
+            if age is not None and self.soft_timeout:
+                return await asyncio.wait_for(asyncio.shield(task), self.soft_timeout)
+            return await asyncio.shield(task)
+        except Exception:
+            if age is not None:
+                return value  # старые данные лучше, чем ошибка
+            raise
@@ -0,0 +1,288 @@
+# tg_gateway.py
+import asyncio
+import itertools
+import logging
+import concurrent.futures
+from typing import Dict, Iterable, Optional, Union
+
+from aiogram.types import InputFile
+from aiogram.utils.exceptions import RetryAfter, NetworkError, BadRequest
+
+from media_cache import media_cache
+
+logger = logging.getLogger(__name__)
+
+# Полосы приоритета (меньше — важнее)
+PRIORITY_INTERACTIVE = 0   # ответы пользователю на его действие
+PRIORITY_ALERT = 1         # уведомления админам (жалобы, суд, тикеты)
+PRIORITY_REPORT = 2        # отчёты и девлоги в группу
+PRIORITY_BROADCAST = 3     # массовые оповещения
+
+# Лимиты Telegram: ~30 сообщений/сек глобально, ~1/сек в личку, ~20/мин в группу.
+# Берём с запасом — ответы через message.answer/edit_text идут мимо очереди.
+GLOBAL_RATE = 25
+GLOBAL_BURST = 25
+PRIVATE_CHAT_INTERVAL = 1.0
+GROUP_CHAT_INTERVAL = 3.0
+MAX_IN_FLIGHT = 8
+MAX_RETRIES = 3
+FANOUT_TIMEOUT = 10
+CHAT_PRUNE_INTERVAL = 60  # сек — как часто выбрасывать чаты, пауза которых уже истекла
+
+# BadRequest, который означает «file_id из кэша больше не годится» (а не ошибку подписи, разметки и т.п.)
+FILE_ID_ERRORS = ("wrong file identifier", "wrong remote file identifier", "file reference")
+
+
+class _RateLimiter:
+    """Token bucket для глобального лимита отправок"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = None
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self._updated is not None:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class _Job:
+    __slots__ = ("method", "args", "kwargs", "chat_id", "priority", "future", "attempts")
+
+    def __init__(self, method, args, kwargs, chat_id, priority, future):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.chat_id = chat_id
+        self.priority = priority
+        self.future = future
+        self.attempts = 0
+
+
+class TelegramGateway:
+    """
+    Единая точка исходящих запросов к Telegram.
+    Принадлежит event loop бота (поток из main.run_bot), поэтому все отправки
+    идут через одну aiohttp-сессию бота. Из потока API (uvicorn) вызовы
+    передаются в loop бота через run_coroutine_threadsafe.
+
+    Все вызовы проходят через приоритетную очередь с глобальным и
+    поканальным лимитом: массовая рассылка не задерживает интерактивные ответы.
+    """
+
+    def __init__(self):
+        self._bot = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._limiter = _RateLimiter(GLOBAL_RATE, GLOBAL_BURST)
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._chat_next: Dict[Union[int, str], float] = {}
+        self._chat_pruned_at = 0.0
+        self._paused_until = 0.0
+        self._seq = itertools.count()
+
+    def attach(self, bot, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """Привязка к боту — вызывается из on_startup внутри loop бота"""
+        self._bot = bot
+        self._loop = loop or asyncio.get_running_loop()
+        self._queue = asyncio.PriorityQueue()
+        self._in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
+        self._dispatcher = self._loop.create_task(self._dispatch_loop())
+        logger.info("📡 Telegram-шлюз привязан к loop бота")
+
+    def detach(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+        if self._queue:
+            while not self._queue.empty():
+                _, _, job = self._queue.get_nowait()
+                if not job.future.done():
+                    job.future.cancel()
+        self._bot = None
+        self._loop = None
+        self._queue = None
+        self._dispatcher = None
+        logger.info("📡 Telegram-шлюз отключён")
+
+    @property
+    def ready(self) -> bool:
+        return self._bot is not None and self._loop is not None and not self._loop.is_closed()
+
+    def queue_size(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def _in_bot_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    # =========================
+    # 📥 ПОСТАНОВКА В ОЧЕРЕДЬ
+    # =========================
+    async def _enqueue(self, method: str, args: tuple, kwargs: dict, priority: int):
+        chat_id = self._chat_key(kwargs.get("chat_id", args[0] if args else None))
+        job = _Job(method, args, kwargs, chat_id, priority, self._loop.create_future())
+        self._queue.put_nowait((priority, next(self._seq), job))
+        return await job.future
+
+    def submit(self, method: str, *args, priority: int = PRIORITY_INTERACTIVE, **kwargs) -> concurrent.futures.Future:
+        """
+        Потокобезопасно ставит вызов Bot.<method>(...) в очередь loop бота.
+        Возвращает concurrent.futures.Future — можно ждать из любого потока.
+        """
+        if not self.ready:
+            raise RuntimeError("Telegram-шлюз не запущен")
+        return asyncio.run_coroutine_threadsafe(self._enqueue(method, args, kwargs, priority), self._loop)
+
+    async def call(self, method: str, *args, priority: int = PRIORITY_INTERACTIVE, **kwargs):
+        """Вызов метода бота из любого event loop"""
+        if not self.ready:
+            raise RuntimeError("Telegram-шлюз не запущен")
+        if self._in_bot_loop():
+            return await self._enqueue(method, args, kwargs, priority)
+        return await asyncio.wrap_future(self.submit(method, *args, priority=priority, **kwargs))
+
+    async def send_message(self, chat_id, text: str, priority: int = PRIORITY_INTERACTIVE, **kwargs):
+        return await self.call("send_message", chat_id, text, priority=priority, **kwargs)
+
+    async def send_photo(self, chat_id, photo, priority: int = PRIORITY_INTERACTIVE, **kwargs):
+        """
+        Отправка фото с кэшем file_id: URL или локальный файл загружается
+        в Telegram один раз, дальше отправляется готовый file_id.
+        """
+        cached = media_cache.get(photo)
+        if cached:
+            try:
+                return await self.call("send_photo", chat_id, cached, priority=priority, **kwargs)
+            except BadRequest as e:
+                if not any(marker in str(e).lower() for marker in FILE_ID_ERRORS):
+                    raise  # ошибка не в файле — повторная загрузка не поможет, кэш верен
+                logger.warning(f"⚠️ file_id из кэша отклонён ({e}), загружаю заново")
+                media_cache.forget(photo)
+
+        payload = InputFile(photo) if media_cache.is_local_file(photo) else photo
+        message = await self.call("send_photo", chat_id, payload, priority=priority, **kwargs)
+        if message is not None and message.photo:
+            media_cache.put(photo, message.photo[-1].file_id)
+        return message
+
+    async def fan_out(self, chat_ids: Iterable, text: str, priority: int = PRIORITY_ALERT,
+                      timeout: float = FANOUT_TIMEOUT, **kwargs) -> Dict[int, Optional[Exception]]:
+        """
+        Параллельная отправка одного сообщения нескольким чатам.
+        Возвращает {chat_id: None | ошибка}; медленный получатель не задерживает остальных.
+        """
+        chat_ids = list(dict.fromkeys(chat_ids))
+
+        async def send_one(chat_id):
+            await asyncio.wait_for(self.send_message(chat_id, text, priority=priority, **kwargs), timeout)
+
+        results = await asyncio.gather(*(send_one(cid) for cid in chat_ids), return_exceptions=True)
+        return {cid: (res if isinstance(res, BaseException) else None) for cid, res in zip(chat_ids, results)}
+
+    # =========================
+    # 🚚 ДИСПЕТЧЕР
+    # =========================
+    @staticmethod
+    def _chat_key(chat_id):
+        """123 и "123" — один чат (одна пауза); @username остаётся строкой"""
+        if isinstance(chat_id, str):
+            try:
+                return int(chat_id)
+            except ValueError:
+                return chat_id
+        return chat_id
+
+    def _chat_wait(self, job: _Job, now: float) -> float:
+        if job.priority == PRIORITY_INTERACTIVE or job.chat_id is None:
+            return 0.0
+        return max(0.0, self._chat_next.get(job.chat_id, 0.0) - now)
+
+    def _mark_chat(self, job: _Job, now: float):
+        if job.chat_id is None:
+            return
+        try:
+            is_private = int(job.chat_id) > 0
+        except (TypeError, ValueError):
+            is_private = False  # @channel_username
+        self._chat_next[job.chat_id] = now + (PRIVATE_CHAT_INTERVAL if is_private else GROUP_CHAT_INTERVAL)
+
+        # Пауза прошла — запись не нужна: иначе словарь растёт с каждым новым получателем
+        if now - self._chat_pruned_at >= CHAT_PRUNE_INTERVAL:
+            self._chat_next = {cid: until for cid, until in self._chat_next.items() if until > now}
+            self._chat_pruned_at = now
+
+    def _requeue(self, item, delay: float):
+        self._loop.call_later(delay, self._put_back, self._queue, item)
+
+    def _put_back(self, queue, item):
+        if queue is self._queue:  # шлюз мог быть перезапущен
+            queue.put_nowait(item)
+
+    async def _dispatch_loop(self):
+        while True:
+            item = await self._queue.get()
+            job = item[2]
+            if job.future.done():  # вызывающий отменил ожидание
+                continue
+
+            now = self._loop.time()
+            if self._paused_until > now:
+                # Flood control: держим всю очередь, порядок сохраняется по seq
+                self._queue.put_nowait(item)
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            wait = self._chat_wait(job, now)
+            if wait > 0:
+                self._requeue(item, wait)
+                continue
+
+            await self._limiter.acquire()
+            await self._in_flight.acquire()
+            self._mark_chat(job, self._loop.time())
+            self._loop.create_task(self._execute(item))
+
+    async def _execute(self, item):
+        job = item[2]
+        try:
+            result = await getattr(self._bot, job.method)(*job.args, **job.kwargs)
+            if not job.future.done():
+                job.future.set_result(result)
+        except RetryAfter as e:
+            job.attempts += 1
+            self._paused_until = max(self._paused_until, self._loop.time() + e.timeout)
+            logger.warning(f"⏳ Flood control: пауза {e.timeout} сек, в очереди {self.queue_size()}")
+            if job.attempts > MAX_RETRIES:
+                self._fail(job, e)
+            else:
+                self._queue.put_nowait(item)
+        except (NetworkError, asyncio.TimeoutError) as e:
+            job.attempts += 1
+            if job.attempts > MAX_RETRIES:
+                self._fail(job, e)
+            else:
+                self._requeue(item, 2 ** job.attempts)
+        except Exception as e:
+            self._fail(job, e)
+        finally:
+            self._in_flight.release()
+
+    @staticmethod
+    def _fail(job: _Job, error: Exception):
+        if not job.future.done():
+            job.future.set_exception(error)
+
+
+gateway = TelegramGateway()